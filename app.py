@@ -1,8 +1,8 @@
 import streamlit as st
-import google.generativeai as genai
 import firebase_admin
 from firebase_admin import credentials, firestore
-from PIL import Image
+from google.api_core import exceptions as gexc
+from sqlite_store import transactional
 import json
 import datetime
 import uuid
@@ -11,13 +11,23 @@ import requests
 import re
 import math
 import io
-
-# --- IMPORT MIC RECORDER ---
-try:
-    from streamlit_mic_recorder import mic_recorder
-except ImportError:
-    st.error("Please install the library: pip install streamlit-mic-recorder")
-    st.stop()
+import threading
+import collections
+import hashlib
+import random
+import os
+import types
+import functools
+import logging
+import contextlib
+import csv
+import html
+import string
+import hmac
+import base64
+import secrets
+import itertools
+import tempfile
 
 # --- 1. CONFIGURATION ---
 st.set_page_config(
@@ -109,6 +119,12 @@ def local_css():
         .card-bg-3 { background-color: #F3E5F5; border: 2px solid #E1BEE7; } 
         .card-bg-4 { background-color: #FFFDE7; border: 2px solid #FFF9C4; } 
 
+        /* Read-only grid: the whole page is one HTML block */
+        .pantry-grid { display: grid; grid-template-columns: repeat(auto-fill, minmax(200px, 1fr)); gap: 16px; margin-bottom: 16px; }
+        .tile-qty { font-size: 0.85rem; font-weight: 700; }
+        .tile-bar { height: 8px; border-radius: 4px; background-color: rgba(0,0,0,0.08); overflow: hidden; margin-top: 8px; }
+        .tile-bar > div { height: 100%; background-color: var(--accent-coral); }
+
         /* --- SOFT INPUTS --- */
         div[data-baseweb="input"] {
             background-color: var(--card-white) !important;
@@ -147,6 +163,18 @@ def local_css():
             color: white !important;
         }
 
+        /* --- PAGE NAV (same pills as the tabs) --- */
+        .st-key-nav div[role="radiogroup"] { gap: 8px; }
+        .st-key-nav div[role="radiogroup"] label {
+            height: 45px;
+            background-color: rgba(255,255,255,0.6);
+            border-radius: 22px;
+            padding: 0 20px;
+            font-weight: 600;
+        }
+        .st-key-nav div[role="radiogroup"] label:has(input:checked) { background-color: var(--accent-coral); }
+        .st-key-nav div[role="radiogroup"] label > div:first-child { display: none; }
+
         [data-testid="stSidebar"] { display: none; }
         header, footer { visibility: hidden; }
         .block-container { padding-top: 1rem; padding-bottom: 5rem; }
@@ -160,18 +188,886 @@ if "GEMINI_API_KEY" in st.secrets:
 else:
     GEMINI_API_KEY = "PASTE_YOUR_LOCAL_KEY_HERE"
 
-try: 
-    genai.configure(api_key=GEMINI_API_KEY)
-except: pass
+# KITCHEN_MIND_STORAGE=sqlite:<path> runs on the embedded SQLite store (single server,
+# offline development) instead of Firestore; no Firebase credentials are needed then.
+STORAGE_URL = os.environ.get("KITCHEN_MIND_STORAGE", "firestore")
 
-if not firebase_admin._apps:
-    try:
-        if "firebase" in st.secrets: cred = credentials.Certificate(dict(st.secrets["firebase"]))
-        else: cred = credentials.Certificate("firebase_key.json")
-        firebase_admin.initialize_app(cred)
-    except: pass
+@st.cache_resource
+def open_store(url=STORAGE_URL):
+    if url.startswith("sqlite:"):
+        import sqlite_store
+        return sqlite_store.SqliteStore(url[len("sqlite:"):] or "kitchen_mind.db")
+    if not firebase_admin._apps:
+        try:
+            if "firebase" in st.secrets: cred = credentials.Certificate(dict(st.secrets["firebase"]))
+            else: cred = credentials.Certificate("firebase_key.json")
+            firebase_admin.initialize_app(cred)
+        except: pass
+    return firestore.client()
+
+db = open_store()
+
+# --- PERFORMANCE METRICS ---
+# Opt-in with KITCHEN_MIND_METRICS=1. Firestore client methods are wrapped once per process,
+# so with metrics off nothing is patched and every call runs untouched.
+METRICS_ENABLED = os.environ.get("KITCHEN_MIND_METRICS") == "1"
+METRICS_ADMINS = {e.strip().lower() for e in os.environ.get("KITCHEN_MIND_ADMINS", "").split(",") if e.strip()}
+METRICS_MAX_SESSIONS = 1000
+metrics_log = logging.getLogger("kitchen_mind.metrics")
+
+# (module, class, method, op, docs): docs is 'rows' to count yielded results,
+# 'writes' to count the pending writes being committed, or a fixed number per call.
+DB_METRIC_TARGETS = [
+    ("google.cloud.firestore_v1.query", "Query", "_make_stream", "query", "rows"),
+    ("google.cloud.firestore_v1.aggregation", "AggregationQuery", "_make_stream", "aggregate", "rows"),
+    ("google.cloud.firestore_v1.client", "Client", "get_all", "get_all", "rows"),
+    ("google.cloud.firestore_v1.document", "DocumentReference", "get", "get", 1),
+    ("google.cloud.firestore_v1.document", "DocumentReference", "set", "set", 1),
+    ("google.cloud.firestore_v1.document", "DocumentReference", "update", "update", 1),
+    ("google.cloud.firestore_v1.document", "DocumentReference", "delete", "delete", 1),
+    ("google.cloud.firestore_v1.collection", "CollectionReference", "add", "add", 1),
+    ("google.cloud.firestore_v1.batch", "WriteBatch", "commit", "batch.commit", "writes"),
+    ("google.cloud.firestore_v1.transaction", "Transaction", "_commit", "transaction.commit", "writes"),
+    ("sqlite_store", "Query", "stream", "query", "rows"),
+    ("sqlite_store", "AggregationQuery", "get", "aggregate", 1),
+    ("sqlite_store", "SqliteStore", "get_all", "get_all", "rows"),
+    ("sqlite_store", "DocumentReference", "get", "get", 1),
+    ("sqlite_store", "DocumentReference", "set", "set", 1),
+    ("sqlite_store", "DocumentReference", "update", "update", 1),
+    ("sqlite_store", "DocumentReference", "delete", "delete", 1),
+    ("sqlite_store", "CollectionReference", "add", "add", 1),
+    ("sqlite_store", "WriteBatch", "commit", "batch.commit", "writes"),
+    ("sqlite_store", "Transaction", "_commit", "transaction.commit", "writes"),
+]
+
+class Metrics:
+    """Calls, documents and seconds per operation."""
+    def __init__(self):
+        self._ops = {}
+        self._lock = threading.Lock()
+
+    def record(self, op, docs, seconds):
+        with self._lock:
+            c = self._ops.setdefault(op, [0, 0, 0.0])
+            c[0] += 1; c[1] += docs; c[2] += seconds
+
+    def snapshot(self):
+        with self._lock:
+            return {op: {'calls': c[0], 'docs': c[1], 'seconds': round(c[2], 4)} for op, c in sorted(self._ops.items())}
+
+    def reset(self):
+        with self._lock: self._ops = {}
+
+class SessionMetrics:
+    def __init__(self, session_id):
+        self.id = session_id
+        self.rerun = Metrics()
+        self.total = Metrics()
+        self.reruns = 0
+        self.last = None
+        self.memory = {}
+        self.memory_at = 0.0
+
+@st.cache_resource
+def get_metrics():
+    """Process-wide counters plus an LRU of per-session counters."""
+    return types.SimpleNamespace(process=Metrics(), sessions=collections.OrderedDict(),
+                                 lock=threading.Lock(), local=threading.local())
+
+def session_metrics(session_id=None):
+    if session_id is None:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+        ctx = get_script_run_ctx(suppress_warning=True)
+        if ctx is None: return None
+        session_id = ctx.session_id
+    m = get_metrics()
+    with m.lock:
+        s = m.sessions.pop(session_id, None) or SessionMetrics(session_id)
+        m.sessions[session_id] = s
+        while len(m.sessions) > METRICS_MAX_SESSIONS: m.sessions.popitem(last=False)
+        return s
+
+def record_metric(op, docs, seconds):
+    get_metrics().process.record(op, docs, seconds)
+    s = session_metrics()
+    if s is not None:
+        s.rerun.record(op, docs, seconds)
+        s.total.record(op, docs, seconds)
+
+def _instrumented(fn, op, docs, exclusive=False):
+    """Wrap fn so each call is recorded under `op`. An exclusive wrapper skips calls made
+    from inside another exclusive one (e.g. the batch behind DocumentReference.update)."""
+    local = get_metrics().local
+
+    def enter():
+        depth = getattr(local, 'depth', 0)
+        if exclusive: local.depth = depth + 1
+        return not (exclusive and depth)
+
+    def leave():
+        if exclusive: local.depth -= 1
+
+    if docs == 'rows':
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            outer = enter()
+            try: it = iter(fn(*args, **kwargs))
+            finally: leave()
+            n, spent = 0, 0.0
+            try:
+                while True:
+                    t = time.perf_counter(); enter()
+                    try: row = next(it)
+                    except StopIteration: break
+                    finally: leave(); spent += time.perf_counter() - t
+                    n += 1
+                    yield row
+            finally:
+                if outer: record_metric(op, n, spent)
+        return wrapper
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        outer = enter()
+        n = len(getattr(args[0], '_write_pbs', ())) if docs == 'writes' else docs
+        t = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+            if callable(n): n = n(result)
+            return result
+        finally:
+            leave()
+            if outer: record_metric(op, n if isinstance(n, int) else 0, time.perf_counter() - t)
+    return wrapper
+
+def timed(op, docs=1):
+    """Decorator recording calls under `op` when metrics are on; returns fn unchanged otherwise.
+    `docs` is a count per call or a function of the result."""
+    def wrap(fn):
+        return _instrumented(fn, op, docs) if METRICS_ENABLED else fn
+    return wrap
+
+@st.cache_resource
+def install_db_metrics():
+    import importlib
+    for module, cls_name, method, op, docs in DB_METRIC_TARGETS:
+        cls = getattr(importlib.import_module(module), cls_name)
+        fn = cls.__dict__.get(method)
+        if fn is None or getattr(fn, '_metric_op', None): continue
+        wrapper = _instrumented(fn, f"db.{op}", docs, exclusive=True)
+        wrapper._metric_op = op
+        setattr(cls, method, wrapper)
+    return True
+
+if METRICS_ENABLED: install_db_metrics()
+
+@contextlib.contextmanager
+def rerun_metrics():
+    """Scope one script run: reset the per-rerun counters, then log and keep them at the end."""
+    s = session_metrics() if METRICS_ENABLED else None
+    if s is None:
+        yield
+        return
+    s.rerun.reset()
+    started = time.perf_counter()
+    try: yield
+    finally:
+        s.reruns += 1
+        s.last = {'rerun': s.reruns, 'seconds': round(time.perf_counter() - started, 4), 'ops': s.rerun.snapshot(),
+                  'memory_bytes': sum(s.memory.values())}
+        metrics_log.info(json.dumps({'event': 'rerun', 'session': s.id, **s.last}))
+
+def prometheus_text(metrics, sessions=()):
+    """Prometheus text exposition of a Metrics snapshot, plus session memory gauges summed
+    over the recently active `sessions`."""
+    snap = metrics.snapshot()
+    lines = []
+    for field, name, kind in (('calls', 'calls_total', 'counter'), ('docs', 'documents_total', 'counter'),
+                              ('seconds', 'seconds_total', 'counter')):
+        lines.append(f"# TYPE kitchen_mind_{name} {kind}")
+        lines += [f'kitchen_mind_{name}{{op="{op}"}} {c[field]}' for op, c in snap.items()]
+    cutoff = time.time() - SESSION_GAUGE_WINDOW
+    active = [s for s in sessions if s.memory_at >= cutoff]
+    kinds = collections.Counter()
+    for s in active: kinds.update(s.memory)
+    lines += ["# TYPE kitchen_mind_active_sessions gauge", f"kitchen_mind_active_sessions {len(active)}",
+              "# TYPE kitchen_mind_session_bytes gauge"]
+    lines += [f'kitchen_mind_session_bytes{{kind="{k}"}} {n}' for k, n in sorted(kinds.items())]
+    lines += ["# TYPE kitchen_mind_session_bytes_max gauge",
+              f"kitchen_mind_session_bytes_max {max((sum(s.memory.values()) for s in active), default=0)}"]
+    return "\n".join(lines) + "\n"
+
+def is_admin():
+    """Admins by KITCHEN_MIND_ADMINS, or by the user's `is_admin` flag. The flag in the session
+    token is only a hint: it is re-checked on the (cached) user, so revoking it takes effect
+    within USER_CACHE_TTL instead of at the token's reissue."""
+    user = st.session_state.get('user_info') or {}
+    email = (user.get('email') or '').lower()
+    if email in METRICS_ADMINS: return True
+    if not user.get('is_admin'): return False
+    current = lookup_user(email)
+    return bool(current and current.get('is_admin'))
+
+def metrics_overlay():
+    """Admin-only panel with the previous rerun, this session and the whole process."""
+    if not (METRICS_ENABLED and is_admin()): return
+    s = session_metrics()
+    if s is None: return
+    rows = lambda snap: [{'op': op, **c} for op, c in snap.items()] or [{'op': '-'}]
+    with st.expander("⏱ Performance", expanded=False):
+        if s.last:
+            st.caption(f"Rerun #{s.last['rerun']} took {s.last['seconds'] * 1000:.0f} ms")
+            st.table(rows(s.last['ops']))
+        st.caption(f"This session · {s.reruns} reruns · {sum(s.memory.values()) / 1024:.0f} KB held "
+                   f"of {SESSION_BUDGET_BYTES / 2**20:g} MB budget")
+        st.table(rows(s.total.snapshot()))
+        st.table([{'state': k, 'KB': round(n / 1024, 1)} for k, n in s.memory.items()] or [{'state': '-'}])
+        m = get_metrics()
+        with m.lock: sessions = list(m.sessions.values())
+        st.download_button("Prometheus metrics", prometheus_text(m.process, sessions),
+                           file_name="kitchen_mind.prom", mime="text/plain")
+
+# --- LIVE HOUSEHOLD REPLICA ---
+# One in-memory copy of each household's pending list per server process. Snapshot
+# listeners push only the changed documents, so reruns read from memory.
+REPLICA_IDLE_SECONDS = 15 * 60
+REPLICA_MAX_HOUSEHOLDS = 500
+REPLICA_SYNC_TIMEOUT = 10
+
+REPLICA_QUERIES = {
+    'shopping_list': lambda hh_id: db.collection('shopping_list').where('household_id','==',hh_id).where('status','==','Pending'),
+}
+
+class HouseholdReplica:
+    """Live copy of one household's pending `shopping_list` documents.
+
+    Each table in REPLICA_QUERIES is subscribed the first time it is read.
+    """
+    def __init__(self, hh_id):
+        self.hh_id = hh_id
+        self.last_used = time.monotonic()
+        self._lock = threading.Lock()
+        self._subscribing = threading.Lock()
+        self._tables = {}
+        self._ready = {}
+        self._watches = {}
+
+    def _subscribe(self, name):
+        """Start the table's listener; it is registered only once on_snapshot succeeds,
+        so a failed attempt is simply retried on the next read."""
+        with self._subscribing:
+            if name in self._ready: return self._ready[name]
+            table, ready = {}, threading.Event()
+            watch = REPLICA_QUERIES[name](self.hh_id).on_snapshot(self._listener(name, table, ready))
+            with self._lock:
+                self._tables[name], self._ready[name], self._watches[name] = table, ready, watch
+            return ready
+
+    def _unsubscribe(self, name):
+        with self._subscribing, self._lock:
+            self._tables.pop(name, None); self._ready.pop(name, None)
+            watch = self._watches.pop(name, None)
+        try: watch and watch.unsubscribe()
+        except: pass
+
+    def _listener(self, name, table, ready):
+        def on_change(docs, changes, read_time):
+            if METRICS_ENABLED: get_metrics().process.record(f"db.listen.{name}", len(changes), 0.0)
+            with self._lock:
+                for ch in changes:
+                    if ch.type.name == 'REMOVED': table.pop(ch.document.id, None)
+                    else: table[ch.document.id] = {'id': ch.document.id, **ch.document.to_dict()}
+            ready.set()
+        return on_change
+
+    def alive(self):
+        """False once any subscribed table has lost its listener, so the registry rebuilds us."""
+        with self._lock: watches = [self._watches.get(name) for name in self._ready]
+        return all(w is not None and getattr(w, 'is_active', True) for w in watches)
+
+    def items(self, name):
+        """Snapshot of a table as a list of dicts; waits for the first sync on a cold replica.
+        A listener that never syncs is dropped so the next read subscribes afresh."""
+        self.last_used = time.monotonic()
+        if not self._subscribe(name).wait(REPLICA_SYNC_TIMEOUT):
+            self._unsubscribe(name)
+            raise TimeoutError(f"{name} replica for {self.hh_id} did not sync")
+        with self._lock:
+            return [dict(d) for d in self._tables.get(name, {}).values()]
+
+    def apply(self, name, doc_id, fields):
+        """Merge a local write so the next rerun sees it before the listener echoes it back."""
+        with self._lock:
+            table = self._tables.get(name)
+            if table is not None: table[doc_id] = {**table.get(doc_id, {'id': doc_id}), **fields}
+
+    def discard(self, name, doc_id):
+        with self._lock: self._tables.get(name, {}).pop(doc_id, None)
+
+    def close(self):
+        for w in list(self._watches.values()):
+            try: w.unsubscribe()
+            except: pass
+
+class ReplicaRegistry:
+    """Process-wide LRU of household replicas; idle households are unsubscribed and dropped."""
+    def __init__(self, idle_seconds=REPLICA_IDLE_SECONDS, max_households=REPLICA_MAX_HOUSEHOLDS):
+        self.idle_seconds = idle_seconds
+        self.max_households = max_households
+        self._replicas = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, hh_id):
+        with self._lock:
+            self._evict(time.monotonic())
+            rep = self._replicas.pop(hh_id, None)
+            if rep is not None and not rep.alive():
+                rep.close(); rep = None
+            if rep is None: rep = HouseholdReplica(hh_id)
+            rep.last_used = time.monotonic()
+            self._replicas[hh_id] = rep
+            while len(self._replicas) > self.max_households:
+                self._replicas.popitem(last=False)[1].close()
+            return rep
+
+    def peek(self, hh_id):
+        """The household's replica if one is live, without creating or refreshing it."""
+        with self._lock: return self._replicas.get(hh_id)
+
+    def _evict(self, now):
+        for key in [k for k, r in self._replicas.items() if now - r.last_used > self.idle_seconds]:
+            self._replicas.pop(key).close()
+
+@st.cache_resource
+def get_replica_registry():
+    return ReplicaRegistry()
+
+def get_replica(hh_id):
+    return get_replica_registry().get(hh_id)
+
+def patch_local(hh_id, name, doc_id, fields=None):
+    """Reflect a committed write in this process's local views: the household replica
+    (if live) and the pantry page cached in this session. `fields=None` means deleted."""
+    rep = get_replica_registry().peek(hh_id)
+    if rep is not None:
+        if fields is None: rep.discard(name, doc_id)
+        else: rep.apply(name, doc_id, fields)
+    page = st.session_state.get('pantry_items') if name == 'inventory' else None
+    if page is None: return
+    if doc_id not in page:
+        # An item this page has not fetched may belong on it; read the page again.
+        if fields is not None: invalidate_pantry_page()
+    elif fields is None: page.pop(doc_id)
+    else: page[doc_id] = {**page[doc_id], **fields}
+
+def invalidate_pantry_page():
+    st.session_state.pop('pantry_page', None)
+
+# --- CHUNKED WRITER ---
+# A Firestore batch holds at most 500 writes. Large saves are cut into chunks that commit
+# in parallel on a shared pool; progress only advances over chunks that committed in order,
+# so a caller can checkpoint the mark it reports and resume from there.
+BULK_CHUNK = 400
+BULK_WORKERS = 4
+
+@st.cache_resource
+def get_bulk_pool():
+    import concurrent.futures
+    return concurrent.futures.ThreadPoolExecutor(max_workers=BULK_WORKERS, thread_name_prefix="bulk")
+
+class ChunkedWriter:
+    """set/update/delete in batch-sized chunks. Use as a context manager: leaving the block
+    commits the rest, waits for every chunk and re-raises the first failure.
+
+    `progress(written, mark)` runs in the caller's thread each time the next chunk in order
+    has committed; `mark` is the last one passed with a write in that chunk (e.g. a row number).
+    """
+    def __init__(self, progress=None, chunk=BULK_CHUNK):
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+        self.progress = progress
+        self.chunk = chunk
+        self.written = 0
+        self._batch, self._ops, self._mark = db.batch(), 0, None
+        self._pending = collections.deque()
+        self._ctx = get_script_run_ctx(suppress_warning=True)
+
+    def __enter__(self): return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None: self.close()
+
+    def set(self, ref, data, merge=False, mark=None):
+        self._batch.set(ref, data, merge=merge); self._added(mark)
+
+    def update(self, ref, data, mark=None):
+        self._batch.update(ref, data); self._added(mark)
+
+    def delete(self, ref, mark=None):
+        self._batch.delete(ref); self._added(mark)
+
+    def reserve(self, n):
+        """Start a new chunk unless `n` more writes fit in this one, so they commit together."""
+        if self._ops + n > self.chunk: self.flush()
+
+    def _added(self, mark):
+        self._ops += 1
+        if mark is not None: self._mark = mark
+        if self._ops >= self.chunk: self.flush()
+
+    def flush(self):
+        if not self._ops: return
+        chunk = (self._batch, self._ops, self._mark)
+        self._batch, self._ops = db.batch(), 0
+        self._pending.append((get_bulk_pool().submit(self._commit, chunk[0]), *chunk[1:]))
+        self._collect(wait=len(self._pending) > 2 * BULK_WORKERS)
+
+    def _commit(self, batch):
+        if self._ctx is not None:
+            from streamlit.runtime.scriptrunner import add_script_run_ctx
+            add_script_run_ctx(threading.current_thread(), self._ctx)
+        return batch.commit()
+
+    def _collect(self, wait=False):
+        while self._pending and (wait or self._pending[0][0].done()):
+            future, ops, mark = self._pending.popleft()
+            future.result()
+            self.written += ops
+            if self.progress: self.progress(self.written, mark)
+            wait = False
+
+    def close(self):
+        if self._ops and not self._pending:
+            # A single chunk commits inline; no thread hop for the common small save.
+            self.written += self._ops
+            self._batch.commit(); self._ops = 0
+            if self.progress: self.progress(self.written, self._mark)
+            return
+        self.flush()
+        while self._pending: self._collect(wait=True)
+
+# --- CONSUMPTION FORECAST ---
+# Every stock change is appended to `inventory_events` as a small delta record, and a drop
+# also folds into a time-decayed rate kept on the item (`use_rate`, units/day, updated at
+# `use_at`), so forecasts never scan the event log. Times are epoch seconds.
+USE_HALF_LIFE_DAYS = 10.0
+USE_MIN_DAYS = 3.0          # shortest history a rate is averaged over; damps the first events
+FORECAST_MIN_EVENTS = 2
+FORECAST_LEAD_DAYS = 3      # list an item this many days before it runs out...
+FORECAST_COVER_DAYS = 7     # ...with enough to last this long
+EVENT_TTL_DAYS = 180
+TOP_UP_REASONS = ("Auto-Refill", "Forecast")
+
+def _use_tau():
+    return USE_HALF_LIFE_DAYS * 86400 / math.log(2)
+
+def stock_event(hh_id, inventory_id, delta):
+    expire = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(days=EVENT_TTL_DAYS)
+    return {"household_id": hh_id, "inventory_id": inventory_id, "delta": float(delta),
+            "at": firestore.SERVER_TIMESTAMP, "expire_at": expire}
+
+def consumption_fields(item, used, now=None):
+    """The item's rate fields after `used` units were consumed: the old rate decays by the time
+    since `use_at` and the new use is added, giving an exponentially weighted units/day."""
+    now = time.time() if now is None else now
+    tau = _use_tau()
+    last = float(item.get('use_at') or now)
+    rate = float(item.get('use_rate') or 0.0) * math.exp(-max(now - last, 0.0) / tau)
+    return {'use_rate': rate + used * 86400 / tau, 'use_at': now,
+            'use_since': float(item.get('use_since') or now), 'use_events': int(item.get('use_events') or 0) + 1}
+
+def forecast_runout(items, now=None):
+    """Days until each item runs out at its current rate (inf when unknown), in one numpy pass."""
+    import numpy as np
+    now = time.time() if now is None else now
+    col = lambda k: np.array([float(i.get(k) or 0.0) for i in items], dtype=np.float64)
+    tau = _use_tau()
+    rate, at, since = col('use_rate'), col('use_at'), col('use_since')
+    events, qty = col('use_events'), np.maximum(col('quantity'), 0.0)
+    # Decay to now, then correct for the short history of young items (the weight has not built up)
+    span = np.maximum(now - since, USE_MIN_DAYS * 86400)
+    rate = rate * np.exp(-np.maximum(now - at, 0.0) / tau) / -np.expm1(-span / tau)
+    known = (events >= FORECAST_MIN_EVENTS) & (rate > 1e-9)
+    days = np.full(len(items), np.inf)
+    days[known] = qty[known] / rate[known]
+    return days, rate
+
+def runout_label(days):
+    if not math.isfinite(days): return ""
+    return "⏳ runs out today" if days < 1 else f"⏳ ~{int(days)}d supply"
+
+def prefill_forecast_list(hh_id):
+    """Put items expected to run out within FORECAST_LEAD_DAYS on the shopping list."""
+    items = [d.to_dict() for d in db.collection('inventory').where('household_id','==',hh_id)
+             .where('use_rate','>',0).stream()]
+    if not items: return
+    days, rate = forecast_runout(items)
+    for item, d, r in zip(items, days, rate):
+        if d > FORECAST_LEAD_DAYS: continue
+        need = max(1.0, math.ceil(r * FORECAST_COVER_DAYS - float(item.get('quantity', 0))))
+        add_to_list(hh_id, item.get('item_name', 'Unknown'), need, item.get('suggested_store', 'General'), "Forecast")
+
+# --- SHOPPING LIST ENTRIES ---
+# A pending entry has a deterministic id per household + item + store, so repeated refills
+# and re-adds update one document instead of piling up duplicates.
+def normalize_name(name):
+    """Lowercased, whitespace-collapsed item name; stored as `name_norm` for prefix search."""
+    return ' '.join(str(name).lower().split())
 
-db = firestore.client()
+# Expiry is stored twice: the 'YYYY-MM-DD' string users see and `expiry_day`, a date ordinal
+# that range queries and badges use without parsing. Undated items sort last.
+NO_EXPIRY_DAY = datetime.date.max.toordinal()
+
+def expiry_fields(value):
+    try: d = value if isinstance(value, datetime.date) else datetime.date.fromisoformat(str(value)[:10])
+    except ValueError: return {"estimated_expiry": str(value or ''), "expiry_day": NO_EXPIRY_DAY}
+    return {"estimated_expiry": str(d), "expiry_day": d.toordinal()}
+
+def as_number(value, default):
+    """float(value), or `default` for a missing or blank cell (st.data_editor fills the
+    columns a row lacks with None)."""
+    return default if value is None or value == '' else float(value)
+
+def with_derived_fields(item):
+    """An inventory document plus the fields that are kept for querying: `name_norm`,
+    `expiry_day` and `low_stock`. Used at every write site that creates an item."""
+    return {**item, **expiry_fields(item.get('estimated_expiry')),
+            "name_norm": normalize_name(item.get('item_name', '')),
+            "low_stock": as_number(item.get('quantity'), 0.0) < as_number(item.get('threshold'), 1.0)}
+
+def expiry_badge(expiry_day, today=None):
+    days_left = expiry_day - (today or datetime.date.today()).toordinal()
+    if expiry_day >= NO_EXPIRY_DAY: return "🟢 No date"
+    if days_left < 0: return "🔴 Expired"
+    if days_left < 7: return f"🟠 {days_left}d left"
+    return f"🟢 {days_left}d left"
+
+def expiring_query(hh_id, days):
+    """Items expiring between today and `days` from now, soonest first."""
+    today = datetime.date.today().toordinal()
+    return (db.collection('inventory').where('household_id','==',hh_id)
+            .where('expiry_day','>=',today).where('expiry_day','<=',today + days).order_by('expiry_day'))
+
+def expired_query(hh_id):
+    return (db.collection('inventory').where('household_id','==',hh_id)
+            .where('expiry_day','<',datetime.date.today().toordinal()).order_by('expiry_day'))
+
+def list_entry_id(hh_id, item_name, store):
+    key = f"{normalize_name(item_name)}|{store or 'General'}"
+    return f"{hh_id}_{hashlib.sha1(key.encode()).hexdigest()[:16]}"
+
+def merged_list_entry(existing, hh_id, item_name, store, qty, reason=None):
+    """Fields for an upsert: refills and forecasts top up to the larger need, manual adds accumulate."""
+    entry = {"item_name": item_name, "household_id": hh_id, "store": store or 'General',
+             "qty_needed": float(qty), "status": "Pending"}
+    if reason: entry["reason"] = reason
+    if existing and existing.get('status') == 'Pending':
+        prev = float(existing.get('qty_needed', 0))
+        entry["item_name"] = existing.get('item_name', item_name)
+        entry["qty_needed"] = max(prev, entry["qty_needed"]) if reason in TOP_UP_REASONS else prev + entry["qty_needed"]
+        if existing.get('reason') and not reason: entry["reason"] = existing['reason']
+    return entry
+
+@transactional
+def _upsert_list_entry(transaction, hh_id, item_name, store, qty, reason=None):
+    ref = db.collection('shopping_list').document(list_entry_id(hh_id, item_name, store))
+    existing = ref.get(transaction=transaction).to_dict()
+    entry = merged_list_entry(existing, hh_id, item_name, store, qty, reason)
+    transaction.set(ref, entry)
+    return ref.id, entry
+
+def add_to_list(hh_id, item_name, qty, store='General', reason=None):
+    return _upsert_list_entry(db.transaction(), hh_id, item_name, store, qty, reason)
+
+# Checked-off entries leave `shopping_list` for `shopping_history`, so the hot collection only
+# holds what is still to buy. History documents carry `expire_at` for a Firestore TTL policy.
+HISTORY_TTL_DAYS = 365
+
+def history_entry(entry, **extra):
+    expire = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(days=HISTORY_TTL_DAYS)
+    return {**entry, 'status': 'Bought', 'bought_at': firestore.SERVER_TIMESTAMP, 'expire_at': expire, **extra}
+
+@transactional
+def _purchase_entry(transaction, hh_id, entry_id):
+    list_ref = db.collection('shopping_list').document(entry_id)
+    entry = list_ref.get(transaction=transaction).to_dict()
+    if not entry or entry.get('status') != 'Pending' or entry.get('household_id') != hh_id: return None
+    name, qty = entry.get('item_name', ''), float(entry.get('qty_needed', 1))
+    match = next(iter(db.collection('inventory').where('household_id','==',hh_id)
+                      .where('name_norm','==',normalize_name(name)).limit(1).stream(transaction=transaction)), None)
+    if match:
+        item, inv_ref = match.to_dict(), match.reference
+        new_qty = float(item.get('quantity', 0)) + qty
+        fields = {'quantity': firestore.Increment(qty), 'low_stock': new_qty < float(item.get('threshold', 1))}
+        if new_qty > float(item.get('initial_quantity', 0)): fields['initial_quantity'] = new_qty
+        transaction.update(inv_ref, fields)
+        transaction.set(db.collection('inventory_events').document(), stock_event(hh_id, inv_ref.id, qty))
+        local = {**fields, 'quantity': new_qty}
+    else:
+        cls = classify_item(name)
+        inv_ref = db.collection('inventory').document()
+        local = with_derived_fields({
+            "item_name": name, "category": cls.category or 'Pantry', "quantity": qty, "initial_quantity": qty,
+            "weight": 0.0, "weight_unit": "count", "threshold": 1.0,
+            "estimated_expiry": str(datetime.date.today() + datetime.timedelta(days=cls.shelf_life)),
+            "suggested_store": entry.get('store', 'General'), "notes": "", "barcode": "", "household_id": hh_id,
+        })
+        transaction.set(inv_ref, {**local, "added_at": firestore.SERVER_TIMESTAMP})
+    transaction.set(db.collection('shopping_history').document(f"{entry_id}_{uuid.uuid4().hex[:8]}"),
+                    history_entry(entry, inventory_id=inv_ref.id))
+    transaction.delete(list_ref)
+    return inv_ref.id, local
+
+def purchase_entry(hh_id, entry_id):
+    """Check off a pending entry: archive it and restock the pantry item of the same name (created
+    if missing), all in one transaction. Returns (inventory_id, fields), or None if already done."""
+    return _purchase_entry(db.transaction(), hh_id, entry_id)
+
+def archive_bought_entries(hh_id):
+    """Move entries left with status 'Bought' (checked off before the purchase flow) to history.
+    Each entry is a set+delete pair committed in one batch."""
+    bought = db.collection('shopping_list').where('household_id','==',hh_id).where('status','==','Bought')
+    with ChunkedWriter() as writer:
+        for d in bought.stream():
+            writer.reserve(2)
+            writer.set(db.collection('shopping_history').document(f"{d.id}_archived"), history_entry(d.to_dict()))
+            writer.delete(d.reference)
+
+def recent_purchases(hh_id, limit=10):
+    return [d.to_dict() for d in db.collection('shopping_history').where('household_id','==',hh_id)
+            .order_by('bought_at', direction='DESCENDING').limit(limit).stream()]
+
+def compact_shopping_list(hh_id):
+    """One-time merge of duplicate pending entries written before ids were deterministic.
+    A group's merged entry and its deletes commit in one batch, so a failed chunk loses
+    nothing; a group too big for one batch writes its merged entry before any delete."""
+    docs = db.collection('shopping_list').where('household_id','==',hh_id).where('status','==','Pending').stream()
+    groups = collections.defaultdict(list)
+    for d in docs:
+        data = d.to_dict()
+        groups[list_entry_id(hh_id, data.get('item_name', ''), data.get('store'))].append((d.id, data))
+    with ChunkedWriter() as writer:
+        for target, entries in groups.items():
+            if len(entries) == 1 and entries[0][0] == target: continue
+            merged = None
+            for _, data in entries:
+                merged = merged_list_entry(merged, hh_id, data.get('item_name', ''), data.get('store'),
+                                           data.get('qty_needed', 1), data.get('reason'))
+            ref = db.collection('shopping_list').document(target)
+            dupes = [db.collection('shopping_list').document(doc_id) for doc_id, _ in entries if doc_id != target]
+            if len(dupes) + 1 > writer.chunk: ref.set(merged)
+            else: writer.reserve(len(dupes) + 1); writer.set(ref, merged)
+            for dupe in dupes: writer.delete(dupe)
+
+def backfill_search_fields(hh_id):
+    """One-time fill of `name_norm` / `added_at` on items written before the pantry browser.
+    Ordered queries skip documents that lack the ordered field."""
+    with ChunkedWriter() as writer:
+        for d in db.collection('inventory').where('household_id','==',hh_id).stream():
+            data, fix = d.to_dict(), {}
+            if 'name_norm' not in data: fix['name_norm'] = normalize_name(data.get('item_name', ''))
+            if 'added_at' not in data: fix['added_at'] = firestore.SERVER_TIMESTAMP
+            if fix: writer.update(d.reference, fix)
+
+def backfill_expiry_day(hh_id):
+    """One-time fill of `expiry_day` from the `estimated_expiry` string on older items."""
+    with ChunkedWriter() as writer:
+        for d in db.collection('inventory').where('household_id','==',hh_id).stream():
+            data = d.to_dict()
+            if 'expiry_day' not in data:
+                writer.update(d.reference, {'expiry_day': expiry_fields(data.get('estimated_expiry'))['expiry_day']})
+
+def backfill_low_stock(hh_id):
+    """One-time fill of the `low_stock` flag the Home dashboard counts."""
+    with ChunkedWriter() as writer:
+        for d in db.collection('inventory').where('household_id','==',hh_id).stream():
+            data = d.to_dict()
+            low = float(data.get('quantity', 0)) < float(data.get('threshold', 1))
+            if data.get('low_stock') != low: writer.update(d.reference, {'low_stock': low})
+
+@st.cache_resource
+def migrated_households():
+    return set()
+
+HOUSEHOLD_MIGRATIONS = [
+    ('list_compacted', compact_shopping_list),
+    ('search_backfilled', backfill_search_fields),
+    ('expiry_backfilled', backfill_expiry_day),
+    ('low_stock_backfilled', backfill_low_stock),
+]
+
+# Recurring clean-ups: (household field holding the last run's day ordinal, task, interval in days).
+HOUSEHOLD_MAINTENANCE = [
+    ('list_archived_day', archive_bought_entries, 1),
+    ('forecast_day', prefill_forecast_list, 1),
+]
+
+def migrate_household(hh_id):
+    for flag, migrate in HOUSEHOLD_MIGRATIONS: ensure_migrated(hh_id, flag, migrate)
+    for field, task, days in HOUSEHOLD_MAINTENANCE: ensure_periodic(hh_id, field, task, days)
+
+def ensure_migrated(hh_id, flag, migrate):
+    """Run a one-time data migration for a household, recorded as `flag` on its household doc."""
+    done = migrated_households()
+    if (hh_id, flag) in done: return
+    def run():
+        hh = db.collection('households').document(hh_id).get()
+        if not (hh.exists and hh.to_dict().get(flag)):
+            migrate(hh_id)
+            db.collection('households').document(hh_id).set({flag: True}, merge=True)
+        done.add((hh_id, flag))
+    run_household_task(hh_id, flag, run)
+
+def ensure_periodic(hh_id, field, task, every_days=1):
+    """Run `task` for a household at most once every `every_days`; checked once a day per process."""
+    today = datetime.date.today().toordinal()
+    done = migrated_households()
+    if (hh_id, field, today) in done: return
+    def run():
+        hh = db.collection('households').document(hh_id).get().to_dict() or {}
+        if hh.get(field, 0) + every_days <= today:
+            task(hh_id)
+            db.collection('households').document(hh_id).set({field: today}, merge=True)
+        done.add((hh_id, field, today))
+    run_household_task(hh_id, field, run)
+
+# A failed migration or clean-up is logged and retried after a growing delay, not on every rerun.
+HOUSEHOLD_RETRY_SECONDS = 60
+HOUSEHOLD_RETRY_MAX = 3600
+
+@st.cache_resource
+def household_task_backoff():
+    return {}
+
+def run_household_task(hh_id, name, fn):
+    backoff = household_task_backoff()
+    retry_at, failures = backoff.get((hh_id, name), (0.0, 0))
+    if time.monotonic() < retry_at: return
+    try: fn()
+    except Exception:
+        failures += 1
+        delay = min(HOUSEHOLD_RETRY_SECONDS * 2 ** (failures - 1), HOUSEHOLD_RETRY_MAX)
+        backoff[(hh_id, name)] = (time.monotonic() + delay, failures)
+        logging.getLogger("kitchen_mind").exception("Household task %s failed for %s (%d in a row); retrying in %ds",
+                                                    name, hh_id, failures, delay)
+        if METRICS_ENABLED: record_metric(f"task.{name}.failed", 1, 0.0)
+    else: backoff.pop((hh_id, name), None)
+
+# --- WRITE-BEHIND EDIT BUFFER ---
+# Pantry edits are staged per session and coalesced per document. Plain field edits go out
+# in one batch; stock edits (quantity, alert limit) each commit in a transaction so the
+# `low_stock` flag and any auto-refill are decided on the stored values.
+EDIT_COALESCE_SECONDS = 2.0
+
+class EditBuffer:
+    """Pending pantry edits for one session, keyed by inventory document id."""
+    def __init__(self, hh_id):
+        self.hh_id = hh_id
+        self.pending = {}
+        self.first_staged = None
+
+    def stage(self, doc_id, fields, delta=0.0):
+        edit = self.pending.setdefault(doc_id, {'fields': {}, 'delta': 0.0})
+        edit['fields'].update(fields)
+        edit['delta'] += delta
+        if self.first_staged is None: self.first_staged = time.monotonic()
+
+    def view(self, item):
+        """The item as the user sees it: stored values plus anything still waiting to be written."""
+        edit = item and self.pending.get(item['id'])
+        if not edit: return item
+        return {**item, **edit['fields'], 'quantity': float(item.get('quantity', 0)) + edit['delta']}
+
+    def discard(self, doc_id):
+        self.pending.pop(doc_id, None)
+
+    def due(self):
+        return bool(self.pending) and time.monotonic() - self.first_staged >= EDIT_COALESCE_SECONDS
+
+    def flush(self):
+        """Write what is staged: plain field edits in one batch, stock edits each in a transaction.
+        An edit leaves `pending` only once written. An item deleted meanwhile (by another member)
+        drops its edit and its local copy; any other failure keeps the edit for the next flush."""
+        if not self.pending: return
+        self.first_staged = None
+        plain = [d for d, e in self.pending.items() if not (e['delta'] or 'threshold' in e['fields'])]
+        one_by_one = [d for d in self.pending if d not in plain]
+        if plain:
+            batch = db.batch()
+            for doc_id in plain: batch.update(db.collection('inventory').document(doc_id), self.pending[doc_id]['fields'])
+            try:
+                batch.commit()
+                for doc_id in plain: patch_local(self.hh_id, 'inventory', doc_id, self.pending.pop(doc_id)['fields'])
+            except gexc.NotFound: one_by_one += plain    # an item is gone; find it one document at a time
+            except Exception: self._keep(plain)
+        for doc_id in one_by_one:
+            try: self._commit(doc_id, self.pending[doc_id])
+            except gexc.NotFound: self.discard(doc_id); patch_local(self.hh_id, 'inventory', doc_id)
+            except Exception: self._keep([doc_id])
+            else: self.discard(doc_id)
+
+    def _keep(self, doc_ids):
+        logging.getLogger("kitchen_mind").exception("Could not save the edits to %s", ", ".join(doc_ids))
+        if self.first_staged is None: self.first_staged = time.monotonic()
+
+    def _commit(self, doc_id, edit):
+        ref = db.collection('inventory').document(doc_id)
+        if edit['delta'] or 'threshold' in edit['fields']:
+            result = _commit_stock_edit(db.transaction(), ref, edit['fields'], edit['delta'], self.hh_id)
+            if result is None: raise gexc.NotFound(f"inventory/{doc_id}")
+            new_qty, low, refill, usage = result
+            patch_local(self.hh_id, 'inventory', doc_id, {**edit['fields'], **usage, 'quantity': new_qty, 'low_stock': low})
+            if refill:
+                patch_local(self.hh_id, 'shopping_list', *refill)
+                st.toast(f"🚨 Added to List")
+        else:
+            ref.update(edit['fields'])
+            patch_local(self.hh_id, 'inventory', doc_id, edit['fields'])
+
+@transactional
+def _commit_stock_edit(transaction, ref, fields, delta, hh_id):
+    """Apply a quantity/threshold edit, keep `low_stock` exact, log the delta and fold a drop into
+    the consumption rate; when a drop crosses the alert limit, add the refill in the same commit.
+    Returns (quantity, low_stock, refill, rate fields), or None if the item no longer exists."""
+    item = ref.get(transaction=transaction).to_dict()
+    if item is None: return None
+    new_qty = float(item.get('quantity', 0)) + delta
+    thresh = float(fields.get('threshold', item.get('threshold', 1)))
+    update = {**fields, 'quantity': firestore.Increment(delta), 'low_stock': new_qty < thresh}
+    usage = consumption_fields(item, -delta) if delta < 0 else {}
+    update.update(usage)
+    if delta: transaction.set(db.collection('inventory_events').document(), stock_event(hh_id, ref.id, delta))
+    if delta >= 0 or new_qty >= thresh:
+        transaction.update(ref, update)
+        return new_qty, new_qty < thresh, None, usage
+    name, store = item.get('item_name', 'Unknown'), item.get('suggested_store', 'General')
+    list_ref = db.collection('shopping_list').document(list_entry_id(hh_id, name, store))
+    existing = list_ref.get(transaction=transaction).to_dict()
+    entry = merged_list_entry(existing, hh_id, name, store, max(1.0, thresh - new_qty), "Auto-Refill")
+    transaction.update(ref, update)
+    transaction.set(list_ref, entry)
+    return new_qty, True, (list_ref.id, entry), usage
+
+def get_edit_buffer(hh_id):
+    buf = st.session_state.get('edits')
+    if buf is None or buf.hh_id != hh_id:
+        buf = st.session_state.edits = EditBuffer(hh_id)
+    return buf
+
+def flush_edits():
+    buf = st.session_state.get('edits')
+    if buf: buf.flush()
+
+def leave_page():
+    """Save pending edits and forget the cached pantry page, so coming back reads fresh."""
+    flush_edits()
+    invalidate_pantry_page()
+
+@st.fragment(run_every=EDIT_COALESCE_SECONDS)
+def edit_flusher():
+    """Mounted only while edits are pending; once they are all written a full rerun unmounts it."""
+    buf = st.session_state.get('edits')
+    if buf and buf.due(): buf.flush()
+    if not (buf and buf.pending): st.rerun()
 
 # --- ASSETS ---
 def get_bean_logo():
@@ -180,63 +1076,971 @@ def get_bean_logo():
 def get_down_arrow():
     return """<svg width="40" height="40" viewBox="0 0 24 24" fill="none" stroke="#FF8C69" stroke-width="3" stroke-linecap="round" stroke-linejoin="round"><path d="M12 5v14M19 12l-7 7-7-7"/></svg>"""
 
+# --- LAZY HEAVY DEPENDENCIES ---
+# Only the page that needs them pays the import cost, the first time it is opened.
+@st.cache_resource(show_spinner=False)
+def load_genai():
+    import google.generativeai as genai
+    try: genai.configure(api_key=GEMINI_API_KEY)
+    except: pass
+    return genai
+
+def load_mic_recorder():
+    try:
+        from streamlit_mic_recorder import mic_recorder
+    except ImportError:
+        st.error("Please install the library: pip install streamlit-mic-recorder")
+        st.stop()
+    return mic_recorder
+
 # --- SMART ICONS ---
+# Grocery vocabulary, one line per group: "<icon> <category> <shelf life days>: term, term, ..."
+# Parsed once at import into an n-gram index, so lookups cost the same for 30 or 3,000 terms.
+GROCERY_VOCAB = """
+🥛 Dairy 7: milk, whole milk, skim milk, oat milk, almond milk, soy milk, buttermilk, cream, half and half
+🥚 Dairy 21: egg
+🧀 Dairy 30: cheese, cheddar, mozzarella, parmesan, feta, brie, cream cheese, cottage cheese
+🧈 Dairy 60: butter, margarine, ghee
+🥣 Dairy 14: yogurt, yoghurt, greek yogurt, kefir, sour cream
+🍞 Pantry 5: bread, bagel, baguette, bun, dinner roll, bread roll, cinnamon roll, tortilla, pita, sourdough
+🥐 Pantry 3: croissant, muffin
+🍚 Pantry 730: rice, quinoa, couscous, oats, oatmeal, cereal, granola, flour, sugar, lentil, bean, chickpea
+🍝 Pantry 730: pasta, spaghetti, penne, macaroni, noodle, lasagna
+🥫 Pantry 730: soup, canned tomato, tomato sauce, pasta sauce, broth, stock, tuna, peanut butter, jam, honey, ketchup, mustard, mayonnaise, vinegar, olive oil, oil
+☕ Beverages 365: coffee, coffee beans, espresso
+🍵 Beverages 730: tea, green tea, black tea, herbal tea, matcha
+🧃 Beverages 10: juice, orange juice, apple juice, lemonade
+🥤 Beverages 270: soda, cola, sparkling water, kombucha
+💧 Beverages 365: water, bottled water
+🍷 Beverages 730: wine, beer
+🍌 Produce 5: banana, plantain
+🍎 Produce 30: apple
+🍐 Produce 10: pear
+🍊 Produce 21: orange, clementine, mandarin, tangerine
+🍋 Produce 21: lemon, lime
+🍇 Produce 7: grape, raisin
+🍓 Produce 4: strawberry, raspberry, blueberry, blackberry, berry, cherry
+🍍 Produce 5: pineapple
+🥭 Produce 6: mango, papaya
+🍉 Produce 7: watermelon, melon, cantaloupe
+🍑 Produce 5: peach, nectarine, plum, apricot
+🥝 Produce 10: kiwi
+🥑 Produce 5: avocado
+🍅 Produce 7: tomato, cherry tomato
+🥕 Produce 21: carrot, parsnip
+🥦 Produce 7: broccoli, cauliflower
+🥬 Produce 5: lettuce, spinach, kale, cabbage, arugula, bok choy, chard, greens
+🥒 Produce 7: cucumber, zucchini, pickle
+🫑 Produce 10: pepper, bell pepper, capsicum
+🌶️ Produce 10: chili, jalapeno
+🧅 Produce 45: onion, shallot, leek, scallion, green onion
+🧄 Produce 90: garlic, ginger
+🥔 Produce 45: potato, sweet potato, yam
+🌽 Produce 5: corn, sweetcorn
+🍄 Produce 6: mushroom
+🍆 Produce 7: eggplant, aubergine
+🥗 Produce 4: salad, salad mix
+🌿 Produce 7: basil, cilantro, parsley, mint, herb
+🍗 Meat 2: chicken, chicken breast, chicken thigh, turkey, duck
+🥩 Meat 3: beef, steak, ground beef, pork, lamb, veal, mince
+🥓 Meat 7: bacon, ham, prosciutto, salami, pepperoni
+🌭 Meat 10: sausage, hot dog, chorizo
+🐟 Meat 2: fish, salmon, cod, tilapia, trout, tuna steak
+🦐 Meat 2: shrimp, prawn, crab, lobster, scallop, mussel
+🫘 Meat 7: tofu, tempeh
+🍔 Frozen 120: burger, patty
+🍕 Frozen 120: pizza, frozen pizza
+🍦 Frozen 180: ice cream, gelato, sorbet, popsicle
+🧊 Frozen 365: ice, frozen peas, frozen vegetables, frozen fruit
+🍪 Snacks 60: cookie, biscuit, cracker
+🍫 Snacks 180: chocolate, candy
+🍿 Snacks 90: popcorn, chips, crisps, pretzel
+🥜 Snacks 180: nut, almond, peanut, cashew, walnut, pistachio, trail mix
+🧂 Spices 1095: salt, black pepper, cinnamon, paprika, cumin, oregano, turmeric, spice, seasoning
+🧻 Household 1095: paper towel, toilet paper, tissue, napkin
+🧽 Household 1095: sponge, dish soap, detergent, bleach, trash bag, foil, plastic wrap
+🧼 Household 1095: soap, shampoo, toothpaste
+"""
+
+CATEGORIES = ["Produce", "Dairy", "Meat", "Pantry", "Frozen", "Spices", "Beverages", "Household"]
+STORES = ["General", "Costco", "Whole Foods", "Trader Joe's"]
+
+CATEGORY_ICONS = {
+    "Produce": "🥬", "Dairy": "🧀", "Meat": "🥩", "Pantry": "🥫", 
+    "Frozen": "❄️", "Snacks": "🍿", "Beverages": "🥤", "Household": "🧻"
+}
+CATEGORY_SHELF_LIFE = {
+    "Produce": 7, "Dairy": 10, "Meat": 3, "Pantry": 365, "Frozen": 180,
+    "Spices": 730, "Beverages": 180, "Household": 1095, "Snacks": 90
+}
+
+ItemClass = collections.namedtuple("ItemClass", "icon canonical category shelf_life")
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+def _inflections(word):
+    forms = {word, word + "s", word + "es"}
+    if word.endswith("y") and word[-2:-1] not in "aeiou": forms.add(word[:-1] + "ies")
+    if word.endswith("f"): forms.add(word[:-1] + "ves")
+    return forms
+
+def _build_vocab_index(vocab):
+    index, longest = {}, 1
+    for line in vocab.strip().splitlines():
+        head, terms = line.split(":", 1)
+        icon, category, days = head.split()
+        for term in terms.split(","):
+            words = _WORD_RE.findall(term.lower())
+            if not words: continue
+            entry = ItemClass(icon, " ".join(words).title(), category, int(days))
+            # Only the last word is inflected: "green onions", "chicken thighs"
+            for last in _inflections(words[-1]):
+                index.setdefault(tuple(words[:-1]) + (last,), entry)
+            longest = max(longest, len(words))
+    return index, longest
+
+VOCAB_INDEX, VOCAB_MAX_WORDS = _build_vocab_index(GROCERY_VOCAB)
+
+@functools.lru_cache(maxsize=4096)
+def classify_item(item_name, category=None):
+    """Icon, canonical name, default category and shelf life for a free-text item name.
+
+    Whole words only ("pineapple" is not "apple", "teapot" is not "tea"). When several
+    terms appear, the last one wins since it is usually the head noun ("apple juice").
+    """
+    words = _WORD_RE.findall(str(item_name).lower())
+    best = None
+    for end in range(len(words), 0, -1):
+        for size in range(min(VOCAB_MAX_WORDS, end), 0, -1):
+            best = VOCAB_INDEX.get(tuple(words[end - size:end]))
+            if best: break
+        if best: break
+    if best: return best
+    cat = category if category in CATEGORY_SHELF_LIFE else None
+    return ItemClass(CATEGORY_ICONS.get(category, "🥗"), str(item_name).strip(), cat, CATEGORY_SHELF_LIFE.get(cat, 30))
+
 def get_smart_icon(item_name, category):
-    name = item_name.lower()
-    icons = {
-        "milk": "🥛", "egg": "🥚", "bread": "🍞", "banana": "🍌", "apple": "🍎", 
-        "chicken": "🍗", "beef": "🥩", "rice": "🍚", "pasta": "🍝", "cheese": "🧀",
-        "yogurt": "🥣", "water": "💧", "coffee": "☕", "tea": "🍵", "juice": "🧃",
-        "cookie": "🍪", "chocolate": "🍫", "carrot": "🥕", "broccoli": "🥦",
-        "onion": "🧅", "garlic": "🧄", "tomato": "🍅", "potato": "🥔", "corn": "🌽",
-        "avocado": "🥑", "salad": "🥗", "pizza": "🍕", "burger": "🍔", "fish": "🐟"
-    }
-    for key, icon in icons.items():
-        if key in name: return icon
-    cat_icons = {
-        "Produce": "🥬", "Dairy": "🧀", "Meat": "🥩", "Pantry": "🥫", 
-        "Frozen": "❄️", "Snacks": "🍿", "Beverages": "🥤", "Household": "🧻"
-    }
-    return cat_icons.get(category, "🥗")
+    return classify_item(item_name or '', category).icon
+
+def enrich_items(items):
+    """Fill missing category / expiry on AI or parsed rows from the classification index."""
+    today = datetime.date.today()
+    for i in items:
+        c = classify_item(i.get('item_name') or '', i.get('category'))
+        if not i.get('category'): i['category'] = c.category or 'Pantry'
+        if not i.get('estimated_expiry'): i['estimated_expiry'] = str(today + datetime.timedelta(days=c.shelf_life))
+    return items
 
 # --- GEMINI HELPER ---
-def parse_voice_to_json(audio_bytes):
-    """Sends audio bytes to Gemini and expects a JSON inventory list back."""
+AI_MODEL = "gemini-1.5-flash"
+AI_TIMEOUT = 30           # seconds per request
+AI_RETRIES = 3
+AI_BACKOFF = 1.0          # base delay, doubled per attempt and jittered
+AI_CACHE_TTL = 6 * 3600
+AI_CACHE_MAX = 256
+# Set KITCHEN_MIND_FAKE_AI=1 to run the AI paths offline against FakeModel.
+USE_FAKE_AI = os.environ.get("KITCHEN_MIND_FAKE_AI") == "1"
+
+# Bump the version whenever the prompt changes so cached results are not reused.
+VOICE_PROMPT_VERSION = 1
+ITEM_SCHEMA_PROMPT = """For each item mentioned, extract:
+- "item_name": (string) The name of the product.
+- "quantity": (number) The numeric count or weight amount. Default to 1 if not specified.
+- "category": (string) Choose best fit from: [Produce, Dairy, Meat, Pantry, Frozen, Spices, Beverages, Household].
+- "estimated_expiry": (string) 'YYYY-MM-DD'. Estimate based on the item type (e.g., Milk = +7 days, Pasta = +365 days).
+
+Example Output: [{"item_name": "Milk", "quantity": 1, "category": "Dairy", "estimated_expiry": "2024-12-01"}]
+Return ONLY the JSON. No markdown formatting.
+"""
+VOICE_PROMPT = """
+Listen to this audio. The user is adding items to their kitchen inventory.
+Extract items as a strictly formatted JSON list of objects.
+""" + ITEM_SCHEMA_PROMPT
+
+SCAN_PROMPT_VERSION = 1
+SCAN_PROMPT = """
+These photos show groceries the user is adding to their kitchen inventory, taken from
+several angles (front, back, expiry label). Use every photo: read the product name from the
+front, the size/count from the back and the printed date from the expiry label when visible.
+Extract items as a strictly formatted JSON list of objects.
+""" + ITEM_SCHEMA_PROMPT
+
+class FakeModel:
+    """Offline stand-in for GenerativeModel: answers every request with a fixed inventory list."""
+    def generate_content(self, parts, **kwargs):
+        today = datetime.date.today()
+        items = [
+            {"item_name": "Milk", "quantity": 1, "category": "Dairy", "estimated_expiry": str(today + datetime.timedelta(days=7))},
+            {"item_name": "Eggs", "quantity": 12, "category": "Dairy", "estimated_expiry": str(today + datetime.timedelta(days=21))},
+            {"item_name": "Pasta", "quantity": 2, "category": "Pantry", "estimated_expiry": str(today + datetime.timedelta(days=365))},
+        ]
+        return types.SimpleNamespace(text=f"Sure! Here you go:\n```json\n{json.dumps(items)}\n```")
+
+@st.cache_resource(show_spinner=False)
+def get_model(name=AI_MODEL):
+    if USE_FAKE_AI: return FakeModel()
+    return load_genai().GenerativeModel(name)
+
+def _transient_errors():
+    return (gexc.ServiceUnavailable, gexc.DeadlineExceeded, gexc.ResourceExhausted,
+            gexc.InternalServerError, gexc.TooManyRequests, TimeoutError, ConnectionError)
+
+@timed("ai.generate")
+def generate_with_retry(parts):
+    """generate_content with a per-request deadline and jittered exponential backoff on transient errors."""
+    transient = _transient_errors()
+    for attempt in range(AI_RETRIES):
+        try:
+            return get_model().generate_content(parts, request_options={"timeout": AI_TIMEOUT})
+        except transient:
+            if attempt == AI_RETRIES - 1: raise
+            time.sleep(AI_BACKOFF * 2 ** attempt * random.uniform(0.5, 1.5))
+
+def extract_json_list(text):
+    """Pull the first JSON list (or single object) out of a model reply, ignoring fences and prose.
+    A list wrapped in a one-key object is unwrapped; one wrapped alongside other fields is rejected."""
+    txt = text.replace('```json', '').replace('```', '').strip()
+    try: data = json.loads(txt)
+    except ValueError:
+        decoder = json.JSONDecoder()
+        for m in re.finditer(r'[\[{]', txt):
+            try:
+                data, _ = decoder.raw_decode(txt, m.start())
+                break
+            except ValueError: continue
+        else: raise ValueError("No JSON found in model reply")
+    if isinstance(data, dict):
+        lists = [v for v in data.values() if isinstance(v, list)]
+        if len(data) == 1 and lists: data = lists[0]            # {"items": [...]}
+        elif any(isinstance(x, dict) for v in lists for x in v):
+            raise ValueError("Model reply wraps its list in an object with other fields")
+        else: data = [data]
+    return [d for d in data if isinstance(d, dict)]
+
+@st.cache_data(ttl=AI_CACHE_TTL, max_entries=AI_CACHE_MAX, show_spinner=False)
+def _voice_items(audio_digest, prompt_version, mime_type, _audio_bytes):
+    # Keyed by content hash + prompt version; failures raise and are not cached.
+    response = generate_with_retry([VOICE_PROMPT, {"mime_type": mime_type, "data": _audio_bytes}])
+    return extract_json_list(response.text)
+
+@timed("ai.parse_voice", docs=len)
+def voice_items(audio_bytes, mime_type="audio/wav"):
+    digest = hashlib.sha256(audio_bytes).hexdigest()
+    return [dict(i) for i in _voice_items(digest, VOICE_PROMPT_VERSION, mime_type, audio_bytes)]
+
+# --- VISION SCAN ---
+# Captures are kept in the session as capped JPEG bytes, not decoded images; pixels are
+# only decoded by the scan job. All captured angles go out in one multimodal request,
+# each downscaled to a bounded JPEG.
+CAPTURE_MAX_SIDE = 1280     # under st.image's 1460 px limit, so previews are served as-is
+CAPTURE_JPEG_QUALITY = 85
+SCAN_MAX_SIDE = 1024
+SCAN_JPEG_QUALITY = 80
+
+def compress_capture(data):
+    """Camera or upload bytes -> JPEG bytes at most CAPTURE_MAX_SIDE on a side."""
+    from PIL import Image, ImageOps
+    img = Image.open(io.BytesIO(data))
+    if img.format == "JPEG" and max(img.size) <= CAPTURE_MAX_SIDE: return data
+    img = ImageOps.exif_transpose(img).convert("RGB")
+    img.thumbnail((CAPTURE_MAX_SIDE, CAPTURE_MAX_SIDE))
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", quality=CAPTURE_JPEG_QUALITY, optimize=True)
+    return buf.getvalue()
+
+def open_capture(data):
+    from PIL import Image
+    return Image.open(io.BytesIO(data))
+
+def image_digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def _scan_jpeg(digest, _data):
+    img = open_capture(_data)
+    if img.format == "JPEG" and max(img.size) <= SCAN_MAX_SIDE: return _data
+    img = img.convert("RGB")
+    img.thumbnail((SCAN_MAX_SIDE, SCAN_MAX_SIDE))
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", quality=SCAN_JPEG_QUALITY, optimize=True)
+    return buf.getvalue()
+
+@st.cache_data(ttl=AI_CACHE_TTL, max_entries=AI_CACHE_MAX, show_spinner=False)
+def _scan_items(digests, prompt_version, _jpegs):
+    # Keyed by the tuple of per-image hashes, so re-analyzing unchanged photos is free.
+    parts = [SCAN_PROMPT] + [{"mime_type": "image/jpeg", "data": j} for j in _jpegs]
+    return extract_json_list(generate_with_retry(parts).text)
+
+def analyze_photos(captures, original_bytes=0):
+    """Capture bytes -> (items, stats) from a single batched vision call; AI errors propagate."""
+    t0 = time.perf_counter()
+    digests = tuple(image_digest(c) for c in captures)
+    jpegs = [_scan_jpeg(d, c) for d, c in zip(digests, captures)]
+    stats = {"raw_bytes": original_bytes, "sent_bytes": sum(len(j) for j in jpegs), "images": len(jpegs)}
+    items = [dict(i) for i in _scan_items(digests, SCAN_PROMPT_VERSION, jpegs)]
+    stats["total_seconds"] = time.perf_counter() - t0
+    return items, stats
+
+# --- BARCODE PRODUCT INDEX ---
+# barcode -> product template (name, category, unit, shelf life, store). Known products are
+# filled in from the household's history or the shared `products` collection without a model call.
+BARCODE_INDEX_PATH = os.environ.get("KITCHEN_MIND_BARCODE_INDEX", "barcode_index.json")
+TEMPLATE_FIELDS = ('item_name', 'category', 'weight', 'weight_unit', 'suggested_store', 'threshold')
+
+def decode_barcodes(captures):
+    """Barcodes found in the photos, via pyzbar (needs the zbar system library). Empty if unavailable."""
+    try: from pyzbar.pyzbar import decode
+    except ImportError: return []
+    codes = []
+    for data in captures:
+        try: codes += [r.data.decode() for r in decode(open_capture(data).convert("L"))]
+        except Exception: pass
+    return list(dict.fromkeys(c for c in codes if c))
+
+def product_template(item):
+    tpl = {k: item[k] for k in TEMPLATE_FIELDS if item.get(k) not in (None, '')}
     try:
-        model = genai.GenerativeModel("gemini-1.5-flash")
-        
-        prompt = """
-        Listen to this audio. The user is adding items to their kitchen inventory.
-        Extract items as a strictly formatted JSON list of objects.
-        For each item mentioned, extract:
-        - "item_name": (string) The name of the product.
-        - "quantity": (number) The numeric count or weight amount. Default to 1 if not specified.
-        - "category": (string) Choose best fit from: [Produce, Dairy, Meat, Pantry, Frozen, Spices, Beverages, Household].
-        - "estimated_expiry": (string) 'YYYY-MM-DD'. Estimate based on the item type (e.g., Milk = +7 days, Pasta = +365 days).
-        
-        Example Output: [{"item_name": "Milk", "quantity": 1, "category": "Dairy", "estimated_expiry": "2024-12-01"}]
-        Return ONLY the JSON. No markdown formatting.
-        """
-        
-        response = model.generate_content([
-            prompt,
-            {"mime_type": "audio/wav", "data": audio_bytes}
-        ])
-        
-        txt = response.text.replace('```json', '').replace('```', '').strip()
-        return json.loads(txt)
-    except Exception as e:
-        st.error(f"AI Error: {e}")
-        return []
+        exp = datetime.date.fromisoformat(str(item.get('estimated_expiry', '')))
+        added = item.get('added_at')
+        added = added.date() if hasattr(added, 'date') else datetime.date.today()
+        tpl['shelf_life_days'] = max(0, (exp - added).days)
+    except ValueError: pass
+    return tpl
+
+def item_from_template(tpl, barcode):
+    days = int(tpl.get('shelf_life_days', 30))
+    return {**{k: tpl[k] for k in TEMPLATE_FIELDS if k in tpl},
+            "quantity": 1.0, "barcode": barcode,
+            "estimated_expiry": str(datetime.date.today() + datetime.timedelta(days=days))}
+
+class BarcodeIndex:
+    """In-process barcode -> template map, backed by `products/{barcode}` and a warm-start JSON file."""
+    def __init__(self, path=BARCODE_INDEX_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._misses = set()
+        try:
+            with open(path) as f: self._templates = json.load(f)
+        except (OSError, ValueError): self._templates = {}
+
+    def lookup(self, barcode, hh_id=None):
+        # The household's own history wins: it carries their naming, store and alert limit.
+        if hh_id:
+            mine = next(db.collection('inventory').where('household_id','==',hh_id)
+                          .where('barcode','==',barcode).limit(1).stream(), None)
+            if mine: return product_template(mine.to_dict())
+        with self._lock:
+            if barcode in self._templates: return self._templates[barcode]
+            if barcode in self._misses: return None
+        doc = db.collection('products').document(barcode).get()
+        if not doc.exists:
+            with self._lock: self._misses.add(barcode)
+            return None
+        self._store(barcode, doc.to_dict())
+        return doc.to_dict()
+
+    def learn(self, barcode, item):
+        tpl = product_template(item)
+        if not barcode or not tpl.get('item_name'): return
+        db.collection('products').document(barcode).set(tpl, merge=True)
+        self._store(barcode, tpl)
+
+    def _store(self, barcode, tpl):
+        with self._lock:
+            self._templates[barcode] = {**self._templates.get(barcode, {}), **tpl}
+            self._misses.discard(barcode)
+            try:
+                tmp = f"{self.path}.tmp"
+                with open(tmp, "w") as f: json.dump(self._templates, f)
+                os.replace(tmp, self.path)
+            except OSError: pass
+
+@st.cache_resource
+def get_barcode_index():
+    return BarcodeIndex()
+
+def learn_products(rows):
+    index = get_barcode_index()
+    for r in rows:
+        if r.get('barcode'):
+            try: index.learn(str(r['barcode']), r)
+            except Exception: pass
+
+def scan_known_products(captures, hh_id):
+    """(items, barcodes) - items for every decoded barcode the index knows, and all barcodes seen."""
+    codes = decode_barcodes(captures)
+    index = get_barcode_index()
+    items = []
+    for code in codes:
+        try: tpl = index.lookup(code, hh_id)
+        except Exception: tpl = None
+        if tpl: items.append(item_from_template(tpl, code))
+    return items, codes
+
+def scan_photos(captures, hh_id, original_bytes=0):
+    """Known barcodes first, the vision model otherwise. Returns (items, stats)."""
+    t0 = time.perf_counter()
+    items, codes = scan_known_products(captures, hh_id)
+    if items:
+        return items, {"raw_bytes": original_bytes, "sent_bytes": 0, "images": 0,
+                       "total_seconds": time.perf_counter() - t0, "barcode": True}
+    items, stats = analyze_photos(captures, original_bytes)
+    # A single product with an unknown barcode: attach it so saving teaches the index
+    if len(items) == 1 and len(codes) == 1: items[0]['barcode'] = codes[0]
+    return items, stats
+
+# --- AUDIO PREPROCESSING ---
+# Recorder WAVs are 44.1 kHz PCM; speech only needs 16 kHz mono with the silence cut off.
+AUDIO_RATE = 16000
+AUDIO_SILENCE_DB = -40        # 20 ms frames quieter than this (dBFS) count as silence
+AUDIO_PAD_SECONDS = 0.2
+AUDIO_CHUNK_SECONDS = 20      # longer recordings are split on silence and sent concurrently
+AUDIO_MAX_WORKERS = 4
+
+def decode_wav(data):
+    """PCM WAV bytes -> (mono float32 samples in [-1, 1], sample rate)."""
+    import wave
+    import numpy as np
+    with wave.open(io.BytesIO(data)) as w:
+        rate, width, channels = w.getframerate(), w.getsampwidth(), w.getnchannels()
+        frames = w.readframes(w.getnframes())
+    if width == 1: pcm = (np.frombuffer(frames, np.uint8).astype(np.float32) - 128) / 128
+    elif width == 2: pcm = np.frombuffer(frames, '<i2').astype(np.float32) / 32768
+    elif width == 4: pcm = np.frombuffer(frames, '<i4').astype(np.float32) / 2147483648
+    else: raise ValueError(f"Unsupported sample width: {width}")
+    return pcm.reshape(-1, channels).mean(axis=1), rate
+
+def resample(samples, rate, target=AUDIO_RATE):
+    import numpy as np
+    if rate == target or not len(samples): return samples
+    n = int(round(len(samples) * target / rate))
+    return np.interp(np.linspace(0, len(samples) - 1, n), np.arange(len(samples)), samples).astype(np.float32)
+
+def _frame_levels(samples, rate):
+    import numpy as np
+    size = max(1, int(rate * 0.02))
+    n = len(samples) // size
+    frames = samples[:n * size].reshape(n, size) if n else samples.reshape(1, -1)
+    return np.sqrt((frames ** 2).mean(axis=1) + 1e-12), size
+
+def trim_silence(samples, rate):
+    import numpy as np
+    levels, size = _frame_levels(samples, rate)
+    loud = np.nonzero(levels > 10 ** (AUDIO_SILENCE_DB / 20))[0]
+    if not len(loud): return samples[:0]
+    pad = int(AUDIO_PAD_SECONDS * rate)
+    return samples[max(0, loud[0] * size - pad):min(len(samples), (loud[-1] + 1) * size + pad)]
+
+def split_on_silence(samples, rate, max_seconds=AUDIO_CHUNK_SECONDS):
+    """Cut at the quietest frame in the last quarter of each window so words are not split."""
+    levels, size = _frame_levels(samples, rate)
+    per_chunk = max(1, int(max_seconds * rate / size))
+    chunks, start = [], 0
+    while len(levels) - start > per_chunk:
+        lo = start + per_chunk * 3 // 4
+        cut = lo + int(levels[lo:start + per_chunk].argmin())
+        chunks.append(samples[start * size:cut * size])
+        start = cut
+    chunks.append(samples[start * size:])
+    return chunks
+
+def encode_audio(samples, rate=AUDIO_RATE):
+    """FLAC when soundfile is installed, otherwise 16-bit PCM WAV. Returns (bytes, mime type)."""
+    import numpy as np
+    buf = io.BytesIO()
+    try:
+        import soundfile
+        soundfile.write(buf, samples, rate, format="FLAC")
+        return buf.getvalue(), "audio/flac"
+    except ImportError: pass
+    import wave
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1); w.setsampwidth(2); w.setframerate(rate)
+        w.writeframes((np.clip(samples, -1, 1) * 32767).astype('<i2').tobytes())
+    return buf.getvalue(), "audio/wav"
+
+def preprocess_audio(raw):
+    """Recorder bytes -> list of (bytes, mime) chunks ready for upload. Falls back to the raw clip."""
+    try:
+        samples, rate = decode_wav(raw)
+        samples = trim_silence(resample(samples, rate), AUDIO_RATE)
+        if not len(samples): return []
+        return [encode_audio(c) for c in split_on_silence(samples, AUDIO_RATE)]
+    except Exception:
+        return [(raw, "audio/wav")]
+
+def merge_voice_items(batches):
+    merged = {}
+    for items in batches:
+        for i in items:
+            # Different pack sizes of one item stay separate rows
+            key = (' '.join(str(i.get('item_name', '')).lower().split()), i.get('weight'), i.get('weight_unit'))
+            if key in merged:
+                try: merged[key]['quantity'] = float(merged[key].get('quantity', 1)) + float(i.get('quantity', 1))
+                except (TypeError, ValueError): pass
+            else: merged[key] = dict(i)
+    return list(merged.values())
+
+def process_voice(raw):
+    """Preprocess, send chunks concurrently, merge. Returns (items, stats); AI errors propagate."""
+    from concurrent.futures import ThreadPoolExecutor
+    from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+    t0 = time.perf_counter()
+    chunks = preprocess_audio(raw)
+    stats = {"raw_bytes": len(raw), "sent_bytes": sum(len(b) for b, _ in chunks), "chunks": len(chunks)}
+    stats["prep_seconds"] = time.perf_counter() - t0
+    items = []
+    if len(chunks) == 1: items = voice_items(*chunks[0])
+    elif chunks:
+        ctx = get_script_run_ctx(suppress_warning=True)
+        with ThreadPoolExecutor(min(AUDIO_MAX_WORKERS, len(chunks)),
+                                initializer=lambda: add_script_run_ctx(ctx=ctx)) as pool:
+            items = merge_voice_items(pool.map(lambda c: voice_items(*c), chunks))
+    stats["total_seconds"] = time.perf_counter() - t0
+    return items, stats
+
+# --- QUICK ADD ---
+# Typed entries such as "2 lbs chicken, dozen eggs, 3 x yogurt" are read locally: a leading
+# (or trailing) quantity in digits, fractions or words, an optional unit or container, then
+# the item, which the shelf-life table above classifies. An amount with a measure ("500g",
+# "2 x 1.5 l") is the pack size, not more items. Only lines naming something the table does not
+# know go to the model.
+QTY_WORDS = {"a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7,
+             "eight": 8, "nine": 9, "ten": 10, "eleven": 11, "twelve": 12, "couple": 2, "pair": 2,
+             "half": 0.5, "dozen": 12}
+# Measures, spelled as the pantry's weight_unit choices
+WEIGHT_UNITS = {"lb": "lbs", "lbs": "lbs", "pound": "lbs", "pounds": "lbs", "oz": "oz", "ounce": "oz", "ounces": "oz",
+                "g": "g", "gram": "g", "grams": "g", "kg": "kg", "kilo": "kg", "kilos": "kg", "ml": "ml",
+                "l": "L", "liter": "L", "liters": "L", "litre": "L", "litres": "L",
+                "gal": "gal", "gallon": "gal", "gallons": "gal"}
+QTY_UNITS = set(WEIGHT_UNITS) | {"pack", "packs", "pk", "bag", "bags", "box", "boxes", "can", "cans", "bottle", "bottles",
+                                 "jar", "jars", "carton", "cartons", "bunch", "bunches", "loaf", "loaves", "head", "heads",
+                                 "x", "of"}
+_QTY_RE = re.compile(r"(\d+/\d+|\d*\.?\d+)([a-z]*)")
+# A comma between digits is a decimal ("1,5 kg rice") or thousands ("1,000 g") comma, not a separator
+_LINE_SPLIT_RE = re.compile(r"(?:[\n;]|(?<!\d),|,(?!\d))+")
+_THOUSANDS_COMMA_RE = re.compile(r"(?<=\d),(?=\d{3}(?!\d))")
+_DECIMAL_COMMA_RE = re.compile(r"(?<=\d),(?=\d)")
+
+TEXT_PROMPT_VERSION = 1
+TEXT_PROMPT = """
+The user typed these lines to add items to their kitchen inventory, one item per line.
+Extract items as a strictly formatted JSON list of objects.
+""" + ITEM_SCHEMA_PROMPT
+
+def _qty_token(word):
+    """The number a quantity word stands for (a trailing unit is allowed: "2lbs", "3x"), else None."""
+    if word in QTY_WORDS: return QTY_WORDS[word]
+    m = _QTY_RE.fullmatch(word)
+    if not m or (m[2] and m[2] not in QTY_UNITS): return None
+    num, _, den = m[1].partition('/')
+    return float(num) / float(den) if den else float(num)
+
+def _size_unit(word, following):
+    """The measure a number is given in, attached ("500g") or as the next word ("500 g")."""
+    attached = _QTY_RE.fullmatch(word)
+    if attached and attached[2]: return WEIGHT_UNITS.get(attached[2])
+    return WEIGHT_UNITS.get(following)
+
+def parse_line(line):
+    """'3 x yogurt' -> {'item_name': 'Yogurt', 'quantity': 3.0}; None if no item is named.
+    Leading counts multiply ("half dozen", "2 dozen"). An amount with a measure is the pack
+    size, kept as weight/weight_unit: '2 lbs chicken' is one 2 lb pack, '2 x 500g pasta' two
+    500 g packs."""
+    line = _DECIMAL_COMMA_RE.sub('.', _THOUSANDS_COMMA_RE.sub('', line))
+    words = line.lower().replace('×', ' x ').strip(" .-*•\t").split()
+    qty, size, i = None, None, 0
+    while i < len(words) - 1:
+        n = _qty_token(words[i])
+        if n is not None and words[i + 1] in ('and', '&'): break     # "half and half"
+        if n is not None:
+            unit = size is None and _size_unit(words[i], words[i + 1])
+            if unit: size = (n, unit)
+            else: qty = n if qty is None else qty * n
+        elif words[i] not in QTY_UNITS: break
+        i += 1
+    words = words[i:]
+    if qty is None and size is None and len(words) > 1:
+        tail = words[-1].lstrip('x')
+        if tail[:1].isdigit() and _qty_token(tail) is not None:
+            unit = _size_unit(tail, None)
+            if unit: size = (_qty_token(tail), unit)
+            else: qty = _qty_token(tail)
+            words = words[:-1]
+            if words[-1] == 'x' and len(words) > 1: words = words[:-1]
+    name = string.capwords(' '.join(words))
+    if not _WORD_RE.search(name.lower()) or name.replace('.', '').isdigit(): return None
+    row = {"item_name": name, "quantity": float(qty) if qty is not None and qty > 0 else 1.0}
+    if size: row["weight"], row["weight_unit"] = float(size[0]), size[1]
+    return row
+
+def parse_quick_add(text, today=None):
+    """Typed lines -> (items, unknown) with no network call. Items follow the voice schema
+    (item_name, quantity, category, estimated_expiry) with expiry from the shelf-life table;
+    `unknown` holds the lines whose item the table does not know, or that name no item."""
+    today = today or datetime.date.today()
+    items, unknown = [], []
+    for line in _LINE_SPLIT_RE.split(text):
+        if not line.strip(): continue
+        row = parse_line(line)
+        c = row and classify_item(row['item_name'])
+        if not (c and c.category):
+            unknown.append(line.strip()); continue
+        row['category'] = c.category
+        row['estimated_expiry'] = str(today + datetime.timedelta(days=c.shelf_life))
+        items.append(row)
+    return merge_voice_items([items]), unknown
+
+@st.cache_data(ttl=AI_CACHE_TTL, max_entries=AI_CACHE_MAX, show_spinner=False)
+def _text_items(text, prompt_version):
+    return extract_json_list(generate_with_retry([TEXT_PROMPT, text]).text)
+
+def read_text_items(lines):
+    """Lines the quick-add parser could not read -> (items, stats) from one model call."""
+    t0 = time.perf_counter()
+    items = [dict(i) for i in _text_items("\n".join(lines), TEXT_PROMPT_VERSION)]
+    return items, {"lines": len(lines), "total_seconds": time.perf_counter() - t0}
+
+# --- AI JOB QUEUE ---
+# Gemini work runs on a process-wide pool instead of in the page script: submitting returns
+# a job id at once and the session polls for it, so pages stay usable while recordings and
+# scans process. Workers take the oldest job whose household is under its running limit;
+# submissions past the queue bounds are refused rather than piling up.
+AI_WORKERS = 4
+AI_QUEUE_MAX = 64             # queued + running, whole process
+AI_HOUSEHOLD_RUNNING = 2      # jobs one household can have running at once
+AI_HOUSEHOLD_PENDING = 6      # queued + running per household
+AI_JOB_TTL = 3600             # uncollected results are dropped after this many seconds
+AI_POLL_SECONDS = 1.0
+AI_JOB_TARGETS = {'voice': ('voice_data', 'voice_stats', "🎤 Voice"), 'scan': ('data', 'scan_stats', "📸 Scan"),
+                  'text': ('voice_data', 'text_stats', "🎤 Voice")}
+
+class QueueFull(Exception):
+    pass
+
+class AIJob:
+    def __init__(self, hh_id, kind, fn, args):
+        self.id = uuid.uuid4().hex[:12]
+        self.hh_id = hh_id
+        self.kind = kind
+        self.fn, self.args = fn, args
+        self.status = 'queued'
+        self.result = self.error = None
+        self.finished = None
+
+class AIJobQueue:
+    """Bounded FIFO with per-household limits, served by a fixed set of daemon threads."""
+    def __init__(self, workers=AI_WORKERS):
+        self._jobs = {}
+        self._queue = collections.deque()
+        self._running = collections.Counter()
+        self._cv = threading.Condition()
+        for n in range(workers):
+            threading.Thread(target=self._work, name=f"ai-worker-{n}", daemon=True).start()
+
+    def submit(self, hh_id, kind, fn, *args):
+        with self._cv:
+            self._prune()
+            active = [j for j in self._jobs.values() if j.status in ('queued', 'running')]
+            if len(active) >= AI_QUEUE_MAX: raise QueueFull("The AI queue is full right now.")
+            if sum(j.hh_id == hh_id for j in active) >= AI_HOUSEHOLD_PENDING:
+                raise QueueFull("Your household already has several jobs processing.")
+            job = AIJob(hh_id, kind, fn, args)
+            self._jobs[job.id] = job
+            self._queue.append(job)
+            self._cv.notify()
+            return job.id
+
+    def status(self, job_id):
+        """'queued', 'running', 'done', 'failed', or None for an unknown or expired id."""
+        with self._cv:
+            job = self._jobs.get(job_id)
+            return job.status if job else None
+
+    def collect(self, job_id):
+        """Remove and return a finished job; None while it is queued or running."""
+        with self._cv:
+            job = self._jobs.get(job_id)
+            if job is None or job.finished is None: return None
+            return self._jobs.pop(job_id)
+
+    def _next(self):
+        for job in self._queue:
+            if self._running[job.hh_id] < AI_HOUSEHOLD_RUNNING:
+                self._queue.remove(job)
+                return job
+        return None
+
+    def _work(self):
+        while True:
+            with self._cv:
+                job = self._next()
+                while job is None:
+                    self._cv.wait()
+                    job = self._next()
+                job.status = 'running'
+                self._running[job.hh_id] += 1
+            try: result, error = job.fn(*job.args), None
+            except Exception as e: result, error = None, str(e)
+            with self._cv:
+                job.result, job.error = result, error
+                job.status = 'failed' if error is not None else 'done'
+                job.finished = time.monotonic()
+                job.fn = job.args = None
+                self._running[job.hh_id] -= 1
+                self._cv.notify_all()
+
+    def _prune(self):
+        now = time.monotonic()
+        for job_id in [j.id for j in self._jobs.values() if j.finished and now - j.finished > AI_JOB_TTL]:
+            del self._jobs[job_id]
+
+@st.cache_resource
+def get_ai_queue():
+    return AIJobQueue()
+
+def submit_ai_job(hh_id, kind, fn, *args):
+    """Queue fn(*args) -> (items, stats) for this session; False if the queue pushed back."""
+    try: job_id = get_ai_queue().submit(hh_id, kind, fn, *args)
+    except QueueFull as e:
+        st.warning(f"{e} Please try again in a moment.")
+        return False
+    st.session_state.ai_jobs[job_id] = kind
+    return True
+
+@st.fragment(run_every=AI_POLL_SECONDS)
+def ai_job_tracker():
+    """Polls this session's jobs from any page; finished items are appended to the review table."""
+    jobs, q = st.session_state.ai_jobs, get_ai_queue()
+    finished = False
+    for job_id, kind in list(jobs.items()):
+        job = q.collect(job_id)
+        if job is None:
+            if q.status(job_id) is None: jobs.pop(job_id)
+            continue
+        jobs.pop(job_id)
+        finished = True
+        data_key, stats_key, page = AI_JOB_TARGETS[kind]
+        if job.error is not None:
+            st.toast(f"AI Error: {job.error}", icon="⚠️"); continue
+        items, st.session_state[stats_key] = job.result
+        if not items:
+            st.toast("No items recognized.", icon="🤔"); continue
+        st.session_state[data_key] = (st.session_state[data_key] or []) + enrich_items(items)
+        if st.session_state.get('nav') != page: st.toast(f"{len(items)} item(s) ready to review on {page}", icon="✅")
+    if jobs: st.caption(f"⏳ Processing {len(jobs)} AI job(s)… keep going, results will appear when ready.")
+    if finished: st.rerun()
+
+# --- SESSION MEMORY ---
+# Heavy per-session state: capture bytes, the voice/scan review tables and the current
+# pantry page. Every rerun, captures and review tables older than their TTL are dropped,
+# then the oldest go first until the session fits its budget. Sizes are reported per
+# session through the metrics overlay and Prometheus text.
+SESSION_BUDGET_BYTES = int(float(os.environ.get("KITCHEN_MIND_SESSION_BUDGET_MB", "8")) * 2**20)
+CAPTURE_TTL = 15 * 60
+REVIEW_TTL = 60 * 60
+REVIEW_KEYS = ('voice_data', 'data')
+SESSION_GAUGE_WINDOW = 15 * 60   # sessions quieter than this are left out of the gauges
+
+def _json_bytes(value):
+    return len(json.dumps(value, default=str)) if value else 0
+
+def session_footprint(state):
+    """Approximate bytes held by each heavy session entry."""
+    imgs = state.get('imgs') or {}
+    return {'captures': sum(len(c) for c in imgs.values() if c),
+            **{k: _json_bytes(state.get(k)) for k in REVIEW_KEYS},
+            'pantry_items': _json_bytes(state.get('pantry_items'))}
+
+def _memory_units(state):
+    """(unit, object, bytes) for each evictable entry: one per capture angle, one per review table."""
+    for angle, c in (state.get('imgs') or {}).items():
+        if c: yield ('imgs', angle), c, len(c)
+    for key in REVIEW_KEYS:
+        v = state.get(key)
+        if v: yield key, v, _json_bytes(v)
+
+def _evict(state, unit):
+    if isinstance(unit, tuple):
+        state.imgs[unit[1]] = None; state.img_bytes.pop(unit[1], None)
+    else: state[unit] = None
+
+def enforce_session_budget(state, now=None):
+    """Apply the TTLs and SESSION_BUDGET_BYTES to this session; returns the evicted units.
+    An entry's age counts from when a new object was first seen under it."""
+    now = time.monotonic() if now is None else now
+    seen = state.get('mem_seen') or {}
+    units = []
+    for unit, obj, size in _memory_units(state):
+        prev = seen.get(unit)
+        units.append(((prev[1] if prev and prev[0] == id(obj) else now), unit, obj, size))
+    units.sort(key=lambda u: (u[0], -u[3]))   # oldest first, larger first among equals
+    evicted, total = [], sum(u[3] for u in units)
+    for i, (born, unit, obj, size) in enumerate(units):
+        ttl = CAPTURE_TTL if isinstance(unit, tuple) else REVIEW_TTL
+        # The newest entry is always kept, even on its own over budget
+        if now - born > ttl or (total > SESSION_BUDGET_BYTES and i < len(units) - 1):
+            _evict(state, unit); evicted.append(unit); total -= size
+    state.mem_seen = {unit: (id(obj), born) for born, unit, obj, _ in units if unit not in evicted}
+    return evicted
+
+def track_session_memory():
+    evicted = enforce_session_budget(st.session_state)
+    if any(isinstance(u, tuple) for u in evicted): st.toast("Older photos were cleared to free memory.", icon="🧹")
+    if any(not isinstance(u, tuple) for u in evicted): st.toast("An old review table was cleared.", icon="🧹")
+    s = session_metrics() if METRICS_ENABLED else None
+    if s is not None: s.memory, s.memory_at = session_footprint(st.session_state), time.time()
+
+# --- ACCOUNTS & SESSIONS ---
+# Users live at `users/{normalized email}` with a scrypt hash, so sign-in is one document
+# read. A signed, expiring token in the `?session=` URL parameter restores the session after
+# a reload or reconnect. That costs one user lookup, cached for USER_CACHE_TTL, which checks
+# the user's `token_version`: signing out bumps it, so every earlier token stops working once
+# servers' user caches expire. A running session reads nothing until its token is past half
+# its lifetime, when it is reissued from that same lookup. Other claims (household, admin
+# flag) are as of issue; is_admin() re-checks the flag against the lookup before admin views.
+# All servers must share `session_secret` in st.secrets (or KITCHEN_MIND_SESSION_SECRET),
+# otherwise tokens only last one process.
+SESSION_PARAM = "session"
+SESSION_TOKEN_TTL = 7 * 86400
+SESSION_USER_FIELDS = ('email', 'household_id', 'is_admin')
+USER_CACHE_TTL = 300
+PASSWORD_SCRYPT_N = 2 ** int(os.environ.get("KITCHEN_MIND_SCRYPT_LOG2N", "14"))
+PASSWORD_SCRYPT_R, PASSWORD_SCRYPT_P = 8, 1
+
+@st.cache_resource
+def session_secret():
+    if "session_secret" in st.secrets: return str(st.secrets["session_secret"]).encode()
+    return os.environ.get("KITCHEN_MIND_SESSION_SECRET", "").encode() or secrets.token_bytes(32)
+
+def normalize_email(email):
+    return str(email or '').strip().lower()
+
+def _b64(raw):
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode()
+
+def _unb64(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+def hash_password(password, n=None):
+    """'scrypt$n$r$p$salt$hash'; the cost is stored with the hash so it can be raised later."""
+    n, r, p = n or PASSWORD_SCRYPT_N, PASSWORD_SCRYPT_R, PASSWORD_SCRYPT_P
+    salt = os.urandom(16)
+    digest = hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, maxmem=256 * n * r, dklen=32)
+    return f"scrypt${n}${r}${p}${_b64(salt)}${_b64(digest)}"
+
+def verify_password(password, stored):
+    try:
+        _, n, r, p, salt, digest = stored.split('$')
+        n, r, p = int(n), int(r), int(p)
+        got = hashlib.scrypt(password.encode(), salt=_unb64(salt), n=n, r=r, p=p, maxmem=256 * n * r, dklen=32)
+    except (ValueError, AttributeError): return False
+    return hmac.compare_digest(got, _unb64(digest))
+
+def needs_rehash(stored):
+    try: return int(stored.split('$')[1]) < PASSWORD_SCRYPT_N
+    except (IndexError, ValueError): return True
+
+def issue_token(user, now=None):
+    claims = {k: user[k] for k in SESSION_USER_FIELDS if user.get(k) is not None}
+    claims['ver'] = int(user.get('token_version', 0))
+    claims['exp'] = int((time.time() if now is None else now) + SESSION_TOKEN_TTL)
+    body = _b64(json.dumps(claims, separators=(',', ':')).encode())
+    return f"{body}.{_b64(hmac.new(session_secret(), body.encode(), 'sha256').digest())}"
+
+def read_token(token, now=None):
+    """The token's claims if the signature is valid and it has not expired, else None."""
+    try:
+        body, sig = str(token).split('.')
+        if not hmac.compare_digest(_unb64(sig), hmac.new(session_secret(), body.encode(), 'sha256').digest()): return None
+        claims = json.loads(_unb64(body))
+    except (ValueError, TypeError): return None
+    return claims if claims.get('exp', 0) > (time.time() if now is None else now) else None
+
+@st.cache_data(ttl=USER_CACHE_TTL, show_spinner=False)
+def lookup_user(email):
+    """The public fields and token version of a user, for token checks; None if the account is gone."""
+    snap = db.collection('users').document(email).get()
+    if not snap.exists: return None
+    return {k: v for k, v in snap.to_dict().items() if k in SESSION_USER_FIELDS + ('token_version',)}
+
+def authenticate(email, password):
+    """The user for valid credentials, else None: one direct read by email. Accounts from
+    before hashing are found by an email query once and moved to the keyed, hashed form."""
+    email = normalize_email(email)
+    if not email or '/' in email: return None
+    ref = db.collection('users').document(email)
+    snap = ref.get()
+    if not snap.exists: return migrate_legacy_user(email, password)
+    user = snap.to_dict()
+    if not verify_password(password, user.get('password_hash')): return None
+    if needs_rehash(user['password_hash']): ref.update({'password_hash': hash_password(password)})
+    return user
+
+def migrate_legacy_user(email, password):
+    legacy = next(db.collection('users').where('email','==',email).limit(1).stream(), None)
+    if legacy is None: return None
+    user = legacy.to_dict()
+    if 'password' not in user or not hmac.compare_digest(str(user['password']).encode(), password.encode()): return None
+    user = {k: v for k, v in user.items() if k != 'password'}
+    user['password_hash'] = hash_password(password)
+    batch = db.batch()
+    batch.create(db.collection('users').document(email), user)
+    batch.delete(legacy.reference)
+    try: batch.commit()
+    except gexc.AlreadyExists: return None  # a keyed account was registered meanwhile
+    return user
+
+def email_taken(email):
+    # Matches keyed and not-yet-migrated accounts alike; both store `email`
+    return next(db.collection('users').where('email','==',email).limit(1).stream(), None) is not None
+
+def start_session(user):
+    st.session_state.user_info = {k: user[k] for k in SESSION_USER_FIELDS if user.get(k) is not None}
+    st.query_params[SESSION_PARAM] = issue_token(user)
+
+def restore_session():
+    """Adopt the URL token, if any. A running session reads nothing until the token is due
+    for reissue; a new one checks the token version against the (cached) user."""
+    token = st.query_params.get(SESSION_PARAM)
+    if not token: return
+    claims = read_token(token)
+    if claims is None:
+        del st.query_params[SESSION_PARAM]
+        return
+    due = claims['exp'] - time.time() < SESSION_TOKEN_TTL / 2
+    if st.session_state.user_info and not due: return
+    user = lookup_user(claims['email'])
+    if user is None or user.get('token_version', 0) != claims.get('ver', 0): return end_session()
+    if due: return start_session(user)
+    st.session_state.user_info = {k: claims[k] for k in SESSION_USER_FIELDS if k in claims}
+
+def end_session():
+    flush_edits()
+    st.session_state.user_info = None
+    if SESSION_PARAM in st.query_params: del st.query_params[SESSION_PARAM]
+
+def sign_out():
+    """End this session and revoke every token issued to the user so far."""
+    email = (st.session_state.user_info or {}).get('email')
+    if email:
+        try: db.collection('users').document(email).update({'token_version': firestore.Increment(1)})
+        except gexc.NotFound: pass
+        lookup_user.clear(email)
+    end_session()
 
 # --- MAIN ---
 def main():
     local_css()
     if 'user_info' not in st.session_state: st.session_state.user_info = None
     if 'imgs' not in st.session_state: st.session_state.imgs = {'f':None,'b':None,'d':None}
+    if 'img_bytes' not in st.session_state: st.session_state.img_bytes = {}
     if 'active' not in st.session_state: st.session_state.active = None
     if 'data' not in st.session_state: st.session_state.data = None
     if 'voice_data' not in st.session_state: st.session_state.voice_data = None
+    if 'ai_jobs' not in st.session_state: st.session_state.ai_jobs = {}
+    track_session_memory()
+    restore_session()
     
     if not st.session_state.user_info:
         login_screen()
@@ -271,19 +2075,16 @@ def login_screen():
                     error_msg = None
                     
                     try:
-                        # Attempt to find user
-                        users=db.collection('users').where('email','==',email.strip().lower()).where('password','==',pw).stream()
-                        u=next(users,None)
-                        if u: 
-                            user_data = u.to_dict()
-                        else: 
+                        # One read by email; the password is checked against its hash
+                        user_data = authenticate(email, pw)
+                        if not user_data:
                             error_msg = "No account found."
                     except Exception as e:
                         error_msg = f"Login Error: {e}"
                     
                     # Process result outside try/except
                     if user_data:
-                        st.session_state.user_info = user_data
+                        start_session(user_data)
                         st.rerun()
                     elif error_msg:
                         st.error(error_msg)
@@ -310,11 +2111,18 @@ def login_screen():
                         try:
                             final_hh_id = ""
                             success_msg = ""
+                            email_key = normalize_email(new_email)
+                            if '/' in email_key:
+                                st.error("That email address is not valid.")
+                                st.stop()
+                            # Accounts from before keyed users are only found by query
+                            if email_taken(email_key):
+                                st.error("An account with that email already exists.")
+                                st.stop()
                             
                             if mode == "Create New Household":
                                 # Create ID
                                 final_hh_id = str(uuid.uuid4())[:6].upper()
-                                db.collection('households').document(final_hh_id).set({"name": hh_input, "id": final_hh_id})
                                 success_msg = f"Kitchen Created! Your Shared ID is: {final_hh_id}"
                             else:
                                 # Join ID
@@ -324,44 +2132,123 @@ def login_screen():
                                     st.stop()
                                 success_msg = "Joined successfully!"
 
-                            db.collection('users').add({
-                                "email": new_email.lower().strip(), 
-                                "password": new_pass, 
-                                "household_id": final_hh_id
-                            })
+                            # create() fails if the email was registered meanwhile
+                            try:
+                                db.collection('users').document(email_key).create({
+                                    "email": email_key, 
+                                    "password_hash": hash_password(new_pass), 
+                                    "household_id": final_hh_id
+                                })
+                            except gexc.AlreadyExists:
+                                st.error("An account with that email already exists.")
+                                st.stop()
+                            if mode == "Create New Household":
+                                db.collection('households').document(final_hh_id).set({"name": hh_input, "id": final_hh_id})
                             st.success(f"{success_msg} Please switch to Sign In.")
                             
                         except Exception as e:
                             st.error(f"Signup Error: {e}")
 
+# --- NAVIGATION ---
+# Session-state router: only the selected page's function runs on a rerun,
+# unlike st.tabs which executes the body of every tab.
+def go_to(page):
+    leave_page()
+    st.session_state.nav = page
+
 def app_interface():
-    # Added '🎤 Voice' to the tabs list
-    t1, t2, t3, t4, t5 = st.tabs(["🏠 Home", "📸 Scan", "🎤 Voice", "📦 Pantry", "🛒 List"])
+    pages = {
+        "🏠 Home": page_home, "📸 Scan": page_scanner, "🎤 Voice": page_voice,
+        "📦 Pantry": page_pantry, "🛒 List": page_list,
+    }
+    if st.session_state.get('nav') not in pages: st.session_state.nav = "🏠 Home"
     hh_id = st.session_state.user_info.get('household_id','DEMO')
+    migrate_household(hh_id)
     
-    with t1: page_home(hh_id)
-    with t2: page_scanner(hh_id)
-    with t3: page_voice(hh_id)
-    with t4: page_pantry(hh_id)
-    with t5: page_list(hh_id)
+    page = st.radio("Page", list(pages), key="nav", horizontal=True, label_visibility="collapsed", on_change=leave_page)
+    if st.session_state.ai_jobs: ai_job_tracker()
+    pages[page](hh_id)
+    metrics_overlay()
+    st.button("Sign out", key="sign_out", on_click=sign_out)
+
+# --- HOME DASHBOARD ---
+# Aggregation queries only: each count/sum costs one read per 1,000 index entries matched,
+# so the dashboard is a handful of reads however big the pantry is. Cached per household.
+DASHBOARD_TTL = 60
+
+def aggregate(query, **aggs):
+    """Run several aggregations on one query, e.g. aggregate(q, items='count', units=('sum', 'quantity'))."""
+    agg = None
+    for alias, spec in aggs.items():
+        kind, field = (spec, None) if isinstance(spec, str) else spec
+        target = agg or query
+        agg = target.count(alias=alias) if kind == 'count' else getattr(target, kind)(field, alias=alias)
+    return {r.alias: r.value for row in agg.get() for r in row}
+
+@st.cache_data(ttl=DASHBOARD_TTL, show_spinner=False)
+def household_stats(hh_id):
+    inv = db.collection('inventory').where('household_id','==',hh_id)
+    pending = db.collection('shopping_list').where('household_id','==',hh_id).where('status','==','Pending')
+    stats = aggregate(inv, items='count', units=('sum', 'quantity'))
+    stats['low'] = aggregate(inv.where('low_stock','==',True), n='count')['n']
+    stats['week'] = aggregate(expiring_query(hh_id, 7), n='count')['n']
+    stats['expired'] = aggregate(expired_query(hh_id), n='count')['n']
+    stats['pending'] = aggregate(pending, n='count')['n']
+    stats['stores'] = {s: aggregate(pending.where('store','==',s), n='count')['n'] for s in STORES}
+    other = stats['pending'] - sum(stats['stores'].values())
+    if other > 0: stats['stores']['Other'] = other
+    return stats
+
+def dashboard(hh_id):
+    try: stats = household_stats(hh_id)
+    except Exception: return
+    c1, c2, c3, c4 = st.columns(4)
+    c1.metric("📦 Items", int(stats['items']), f"{stats['units'] or 0:g} units", delta_color="off")
+    c2.metric("🚨 Running Low", int(stats['low']))
+    c3.metric("⏳ Expiring This Week", int(stats['week']), f"{int(stats['expired'])} expired" if stats['expired'] else None, delta_color="inverse")
+    c4.metric("🛒 On the List", int(stats['pending']))
+    stores = {s: n for s, n in stats['stores'].items() if n}
+    if stores: st.caption(" · ".join(f"📍 {s}: {int(n)}" for s, n in stores.items()))
 
 def page_home(hh_id):
     st.markdown("## Good Morning!")
+    dashboard(hh_id)
     st.write("What would you like to do today?")
     c1,c2,c3 = st.columns(3)
     with c1: 
-        if st.button("📸 Scan New Items", use_container_width=True): st.info("Tap the 'Scan' tab above!")
+        st.button("📸 Scan New Items", use_container_width=True, on_click=go_to, args=("📸 Scan",))
     with c2:
-        if st.button("🎤 Voice Add", use_container_width=True): st.info("Tap the 'Voice' tab above!")
+        st.button("🎤 Voice Add", use_container_width=True, on_click=go_to, args=("🎤 Voice",))
     with c3:
         if st.button("📝 Add Manually", use_container_width=True): manual_add_dialog(hh_id)
+    quick_add_pantry(hh_id)
+    
+    expiring_panel(hh_id)
+
+@st.cache_data(ttl=DASHBOARD_TTL, show_spinner=False)
+def soon_items(hh_id, days=7, limit=8):
+    expired = [d.to_dict() for d in expired_query(hh_id).limit(limit).stream()]
+    return expired + [d.to_dict() for d in expiring_query(hh_id, days).limit(limit).stream()]
+
+def expiring_panel(hh_id):
+    """Expired and soon-to-expire items from two indexed range queries, cached with the dashboard."""
+    try: items = soon_items(hh_id)
+    except Exception: return
+    if not items: return
+    st.divider()
+    st.markdown("### ⏳ Use These Soon")
+    today = datetime.date.today()
+    for d in items:
+        c1, c2 = st.columns([4, 1])
+        c1.markdown(f"{get_smart_icon(d.get('item_name', ''), d.get('category'))} **{d.get('item_name', 'Unknown')}**")
+        c2.caption(expiry_badge(d.get('expiry_day', NO_EXPIRY_DAY), today))
 
 @st.dialog("Add Item")
 def manual_add_dialog(hh_id):
     with st.form("add"):
         c1, c2 = st.columns([2,1])
         name = c1.text_input("Item Name")
-        category = c2.selectbox("Category", ["Produce", "Dairy", "Meat", "Pantry", "Frozen", "Spices", "Beverages", "Household"])
+        category = c2.selectbox("Category", CATEGORIES)
         
         st.markdown("##### Details")
         c3, c4, c5 = st.columns(3)
@@ -374,26 +2261,60 @@ def manual_add_dialog(hh_id):
         threshold = c7.number_input("Alert Limit", 1.0)
         expiry = c8.date_input("Expiry", datetime.date.today() + datetime.timedelta(days=7))
         
-        store = st.selectbox("Store", ["General", "Costco", "Whole Foods", "Trader Joe's"])
+        store = st.selectbox("Store", STORES)
         notes = st.text_area("Notes")
         barcode = st.text_input("Barcode (Optional)")
         
         if st.form_submit_button("Save"):
-            db.collection('inventory').add({
+            item = with_derived_fields({
                 "item_name":name, "category":category, "quantity":qty, "initial_quantity":init_qty,
                 "weight":weight, "weight_unit":w_unit, "threshold":threshold,
                 "estimated_expiry":str(expiry), "suggested_store":store, "notes":notes, "barcode":barcode,
                 "household_id":hh_id, "added_at":firestore.SERVER_TIMESTAMP
             })
+            db.collection('inventory').add(item)
+            learn_products([item])
             st.rerun()
 
+def quick_add_pantry(hh_id):
+    """Typed items straight into the pantry; lines the parser cannot read go to the model and
+    come back in the Voice review table."""
+    with st.form("quick_add_home", clear_on_submit=True):
+        text = st.text_area("Quick add", key="qa_home", height=80, label_visibility="collapsed",
+                            placeholder="Quick add: 2 lbs chicken, dozen eggs, 3 x yogurt")
+        if not (st.form_submit_button("➕ Add to Pantry", use_container_width=True) and text.strip()): return
+    items, unknown = parse_quick_add(text)
+    if items:
+        save_to_pantry(hh_id, items)
+        st.toast(f"Added {len(items)} item(s) to the pantry.", icon="✅")
+    if unknown and submit_ai_job(hh_id, 'text', read_text_items, unknown): st.rerun()
+
 # --- NEW VOICE FEATURE ---
+def save_to_pantry(hh_id, rows):
+    """Voice-schema rows (item_name, quantity, category, estimated_expiry, optionally weight and
+    weight_unit) -> new inventory items."""
+    with ChunkedWriter() as writer:
+        for i in rows:
+            # Merge defaults
+            writer.set(db.collection('inventory').document(), with_derived_fields({
+                "item_name": i.get('item_name', 'Unknown'),
+                "category": i.get('category', 'Pantry'),
+                "quantity": as_number(i.get('quantity'), 1.0),
+                "initial_quantity": as_number(i.get('quantity'), 1.0),
+                "estimated_expiry": i.get('estimated_expiry') or str(datetime.date.today() + datetime.timedelta(days=30)),
+                "household_id": hh_id,
+                "added_at": firestore.SERVER_TIMESTAMP,
+                "threshold": 1.0,
+                **{k: i[k] for k in ('weight', 'weight_unit') if i.get(k)}
+            }))
+
 def page_voice(hh_id):
     st.markdown("## 🎤 Voice Input")
     st.info("Tap the mic and list your groceries naturally.")
     
     # Audio recorder component
     # Returns a dictionary: {'bytes': b'...', 'sample_rate': 44100, ...}
+    mic_recorder = load_mic_recorder()
     audio = mic_recorder(
         start_prompt="Start Recording",
         stop_prompt="Stop Recording",
@@ -406,42 +2327,34 @@ def page_voice(hh_id):
     if audio:
         st.audio(audio['bytes'])
         if st.button("⚡ Process Audio", type="primary", use_container_width=True):
-            with st.spinner("Listening & Sorting..."):
-                # Send raw bytes to Gemini
-                extracted = parse_voice_to_json(audio['bytes'])
-                if extracted:
-                    st.session_state.voice_data = extracted
-                    st.rerun()
+            # Downsampled, trimmed chunks go to Gemini instead of the raw recording
+            if submit_ai_job(hh_id, 'voice', process_voice, audio['bytes']): st.rerun()
     
     # Show Review Table if data exists
     if st.session_state.voice_data:
         st.divider()
         st.markdown("### Review Detected Items")
+        vs = st.session_state.get('voice_stats')
+        if vs:
+            saved = 1 - vs['sent_bytes'] / max(vs['raw_bytes'], 1)
+            st.caption(f"Uploaded {vs['sent_bytes']/1024:.0f} KB instead of {vs['raw_bytes']/1024:.0f} KB "
+                       f"({saved:.0%} smaller, {vs['chunks']} chunk(s)) · {vs['total_seconds']:.1f}s end-to-end")
         df = st.data_editor(st.session_state.voice_data, num_rows="dynamic", use_container_width=True)
         
         if st.button("Confirm & Save to Pantry", use_container_width=True):
-            batch = db.batch()
-            for i in df:
-                ref = db.collection('inventory').document()
-                # Merge defaults
-                clean_item = {
-                    "item_name": i.get('item_name', 'Unknown'),
-                    "category": i.get('category', 'Pantry'),
-                    "quantity": float(i.get('quantity', 1.0)),
-                    "initial_quantity": float(i.get('quantity', 1.0)),
-                    "estimated_expiry": i.get('estimated_expiry', str(datetime.date.today() + datetime.timedelta(days=30))),
-                    "household_id": hh_id,
-                    "added_at": firestore.SERVER_TIMESTAMP,
-                    "threshold": 1.0
-                }
-                batch.set(ref, clean_item)
-            
-            batch.commit()
+            save_to_pantry(hh_id, df)
             st.session_state.voice_data = None
             st.success("Added to Pantry!")
             time.sleep(1.5)
             st.rerun()
 
+def scanned_item(hh_id, row):
+    """A reviewed scan row -> inventory document; cells left empty take the usual defaults."""
+    item = {k: v for k, v in row.items() if v is not None and v != ''}
+    qty = as_number(item.get('quantity'), 1.0)
+    return with_derived_fields({**item, "quantity": qty, "initial_quantity": qty, "household_id": hh_id,
+                                "added_at": firestore.SERVER_TIMESTAMP})
+
 def page_scanner(hh_id):
     st.markdown("## 📸 Kitchen Mind")
     st.info("Capture 3 angles for best results.")
@@ -453,10 +2366,12 @@ def page_scanner(hh_id):
             if st.session_state.imgs[key]:
                 st.image(st.session_state.imgs[key], use_container_width=True)
                 if st.button("Clear", key=f"del_{key}"): 
-                    st.session_state.imgs[key]=None; st.rerun()
+                    st.session_state.imgs[key]=None; st.session_state.img_bytes.pop(key, None); st.rerun()
             elif st.session_state.active == key:
                 p = st.camera_input("Snap", key=f"cam_{key}", label_visibility="collapsed")
-                if p: st.session_state.imgs[key] = Image.open(p); st.session_state.active = None; st.rerun()
+                if p:
+                    st.session_state.imgs[key] = compress_capture(p.getvalue()); st.session_state.img_bytes[key] = p.size
+                    st.session_state.active = None; st.rerun()
             else:
                 if st.button("Tap to Snap", key=f"btn_{key}", use_container_width=True): st.session_state.active = key; st.rerun()
 
@@ -468,103 +2383,448 @@ def page_scanner(hh_id):
     if valid:
         st.divider()
         if st.button("✨ Analyze Photos", type="primary", use_container_width=True):
-            with st.spinner("Reading..."):
-                # Placeholder for Image Scan Logic (requires Gemini Vision code)
-                # In a real scenario, you would send valid[0] to Gemini Vision similar to the audio function
-                st.session_state.data = [{"item_name":"Scanned Product", "quantity":1.0, "category":"Pantry"}]
+            if submit_ai_job(hh_id, 'scan', scan_photos, valid, hh_id, sum(st.session_state.img_bytes.values())):
                 st.rerun()
 
     if st.session_state.data:
+        ss = st.session_state.get('scan_stats')
+        if ss and ss.get('barcode'):
+            st.caption(f"⚡ Known barcode - filled in locally in {ss['total_seconds']*1000:.0f} ms, no AI call")
+        elif ss:
+            saved = 1 - ss['sent_bytes'] / max(ss['raw_bytes'], 1)
+            st.caption(f"Uploaded {ss['sent_bytes']/1024:.0f} KB for {ss['images']} photo(s) instead of "
+                       f"{ss['raw_bytes']/1024:.0f} KB ({saved:.0%} smaller) · {ss['total_seconds']:.1f}s end-to-end")
         df = st.data_editor(st.session_state.data, num_rows="dynamic")
         if st.button("Save to Pantry"):
-            batch=db.batch()
-            for i in df:
-                ref=db.collection('inventory').document()
-                batch.set(ref,{**i,"household_id":hh_id,"initial_quantity":i.get('quantity',1)})
-            batch.commit(); st.session_state.data=None; st.rerun()
+            with ChunkedWriter() as writer:
+                for i in df:
+                    writer.set(db.collection('inventory').document(), scanned_item(hh_id, i))
+            learn_products(df); st.session_state.data=None; st.rerun()
+
+# --- BULK IMPORT / EXPORT ---
+# CSV or JSON Lines in and out, per household. Imports stream rows through the chunked
+# writer and checkpoint in `imports/{household}_{kind}_{file hash}`, so re-uploading the
+# same file after an interruption resumes at the last committed chunk. Rows exported from
+# this household keep their document id; other ids are derived from the household and row,
+# so a re-run or a re-import overwrites instead of duplicating.
+BULK_FIELDS = {
+    'inventory': ["item_name", "category", "quantity", "initial_quantity", "threshold", "estimated_expiry",
+                  "suggested_store", "weight", "weight_unit", "barcode", "notes", "added_at"],
+    'shopping_list': ["item_name", "qty_needed", "store", "status", "reason"],
+}
+BULK_LABELS = {'inventory': "Pantry", 'shopping_list': "Shopping list"}
+EXPORT_PAGE_SIZE = 500
+IMPORT_MAX_ERRORS = 50
+
+def read_rows(file_name, stream):
+    """Rows of an uploaded .csv, .jsonl or .json file as dicts; CSV and JSON Lines are read lazily."""
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    name = file_name.lower()
+    if name.endswith('.csv'):
+        yield from csv.DictReader(text)
+    elif name.endswith(('.jsonl', '.ndjson')):
+        for line in text:
+            if line.strip(): yield json.loads(line)
+    else:
+        data = json.load(text)
+        yield from (data if isinstance(data, list) else [data])
+
+def _number(row, key, default):
+    value = row.get(key)
+    if value in (None, ''): return default
+    try: return float(value)
+    except (TypeError, ValueError): raise ValueError(f"{key} must be a number, got {value!r}")
+
+def clean_row(kind, hh_id, row):
+    """Validated document for one imported row; raises ValueError with the reason."""
+    if not isinstance(row, dict): raise ValueError("row is not an object")
+    name = str(row.get('item_name') or '').strip()
+    if not name: raise ValueError("item_name is required")
+    if kind == 'shopping_list':
+        qty = _number(row, 'qty_needed', 1.0)
+        if qty <= 0: raise ValueError("qty_needed must be positive")
+        status = row.get('status') or 'Pending'
+        if status not in ('Pending', 'Bought'): raise ValueError(f"unknown status {status!r}")
+        entry = {"item_name": name, "household_id": hh_id, "qty_needed": qty,
+                 "store": row.get('store') or 'General', "status": status}
+        if row.get('reason'): entry['reason'] = str(row['reason'])
+        return entry
+    qty = _number(row, 'quantity', 1.0)
+    if qty < 0: raise ValueError("quantity cannot be negative")
+    cls = classify_item(name, row.get('category'))
+    expiry = str(row.get('estimated_expiry') or '').strip()
+    if expiry:
+        try: datetime.date.fromisoformat(expiry[:10])
+        except ValueError: raise ValueError(f"estimated_expiry must be YYYY-MM-DD, got {expiry!r}")
+    else: expiry = str(datetime.date.today() + datetime.timedelta(days=cls.shelf_life))
+    try: added = datetime.datetime.fromisoformat(str(row.get('added_at')))
+    except ValueError: added = firestore.SERVER_TIMESTAMP
+    return with_derived_fields({
+        "item_name": name, "category": row.get('category') or cls.category or 'Pantry',
+        "quantity": qty, "initial_quantity": _number(row, 'initial_quantity', qty),
+        "threshold": _number(row, 'threshold', 1.0), "estimated_expiry": expiry[:10],
+        "suggested_store": row.get('suggested_store') or 'General', "weight": _number(row, 'weight', 0.0),
+        "weight_unit": row.get('weight_unit') or 'count', "barcode": str(row.get('barcode') or ''),
+        "notes": str(row.get('notes') or ''), "household_id": hh_id, "added_at": added,
+    })
+
+_DOC_ID_RE = re.compile(r"[A-Za-z0-9_\-]{1,128}")
+
+def owned_ids(kind, hh_id, rows):
+    """The `id` values in rows that name an existing document of this household, in one batched read."""
+    ids = {str(r['id']) for r in rows if isinstance(r, dict) and r.get('id') and _DOC_ID_RE.fullmatch(str(r['id']))}
+    if not ids: return set()
+    snaps = db.get_all([db.collection(kind).document(i) for i in ids])
+    return {s.id for s in snaps if s.exists and (s.to_dict() or {}).get('household_id') == hh_id}
+
+def import_doc_id(kind, hh_id, entry, row, digest, row_no, owned=()):
+    """An `id` column naming one of this household's documents (`owned`) is kept, so re-importing
+    an export updates in place. New pending list entries get their merge key. Other rows get an
+    id scoped to the household: one carrying its import prefix is kept, anything else is hashed,
+    so a file can never overwrite another household's documents."""
+    key = str(row.get('id') or '')
+    if key in owned: return key
+    if kind == 'shopping_list' and entry['status'] == 'Pending':
+        return list_entry_id(hh_id, entry['item_name'], entry['store'])
+    prefix = f"imp_{hashlib.sha1(hh_id.encode()).hexdigest()[:8]}_"
+    if key.startswith(prefix) and re.fullmatch(r"[0-9a-f]{20}", key[len(prefix):]): return key
+    return prefix + hashlib.sha1(f"{kind}|{key or f'{digest}:{row_no}'}".encode()).hexdigest()[:20]
+
+def import_rows(hh_id, kind, file_name, data, progress=None):
+    """Validate and write an uploaded file's rows. Returns (written, errors, resumed_from);
+    `progress(rows_done)` is called after each committed chunk."""
+    digest = hashlib.sha256(data).hexdigest()[:16]
+    ckpt_ref = db.collection('imports').document(f"{hh_id}_{kind}_{digest}")
+    ckpt = ckpt_ref.get().to_dict() or {}
+    start = 0 if ckpt.get('done') else ckpt.get('rows_done', 0)
+    errors = []
+
+    def committed(written, rows_done):
+        ckpt_ref.set({'household_id': hh_id, 'kind': kind, 'file_name': file_name,
+                      'rows_done': rows_done, 'done': False}, merge=True)
+        if progress: progress(rows_done)
+
+    def chunks():
+        # Rows in groups of BULK_CHUNK, so ids can be checked against the store in one read each
+        group = []
+        for row_no, row in enumerate(read_rows(file_name, io.BytesIO(data))):
+            if row_no < start: continue
+            group.append((row_no, row))
+            if len(group) == BULK_CHUNK: yield group; group = []
+        if group: yield group
+
+    rows_done = start
+    with ChunkedWriter(progress=committed) as writer:
+        for group in chunks():
+            owned = owned_ids(kind, hh_id, [r for _, r in group])
+            for row_no, row in group:
+                rows_done = row_no + 1
+                try: entry = clean_row(kind, hh_id, row)
+                except ValueError as e:
+                    if len(errors) < IMPORT_MAX_ERRORS: errors.append({'row': row_no + 1, 'error': str(e)})
+                    continue
+                doc_id = import_doc_id(kind, hh_id, entry, row, digest, row_no, owned)
+                writer.set(db.collection(kind).document(doc_id), entry, mark=rows_done)
+    ckpt_ref.set({'household_id': hh_id, 'kind': kind, 'file_name': file_name, 'rows_done': rows_done,
+                  'done': True, 'errors': len(errors)}, merge=True)
+    return writer.written, errors, start
+
+def export_rows(hh_id, kind, page_size=EXPORT_PAGE_SIZE):
+    """A household's documents, one query page at a time in document-id order."""
+    q = db.collection(kind).where('household_id','==',hh_id)
+    cursor = None
+    while True:
+        page = list((q.start_after(cursor) if cursor else q).limit(page_size).stream())
+        for d in page: yield {'id': d.id, **d.to_dict()}
+        if len(page) < page_size: return
+        cursor = page[-1]
+
+def count_rows(file_name, data):
+    return sum(1 for _ in read_rows(file_name, io.BytesIO(data)))
+
+def export_file(hh_id, kind, fmt):
+    """The export written through an unbuffered temporary file, one query page in memory at a time."""
+    raw = tempfile.TemporaryFile(buffering=0)
+    out = io.TextIOWrapper(io.BufferedWriter(raw), encoding='utf-8', newline='')
+    write_export(export_rows(hh_id, kind), kind, fmt, out)
+    out.flush(); out.detach().detach()
+    raw.seek(0)
+    return raw
+
+def write_export(rows, kind, fmt, out):
+    """Write rows to a text file as CSV or JSON Lines; returns the row count."""
+    cols = ['id'] + BULK_FIELDS[kind]
+    writer = csv.DictWriter(out, fieldnames=cols, extrasaction='ignore') if fmt == 'csv' else None
+    if writer: writer.writeheader()
+    n = 0
+    for row in rows:
+        row = {k: (v.isoformat() if hasattr(v, 'isoformat') else v) for k, v in row.items() if k in cols}
+        if writer: writer.writerow(row)
+        else: out.write(json.dumps(row) + "\n")
+        n += 1
+    return n
+
+@st.dialog("Import / Export")
+def bulk_dialog(hh_id):
+    kind = st.radio("Data", list(BULK_FIELDS), format_func=BULK_LABELS.get, horizontal=True)
+    mode = st.radio("Mode", ["Import", "Export"], horizontal=True, label_visibility="collapsed")
+    if mode == "Export":
+        fmt = st.radio("Format", ["csv", "jsonl"], horizontal=True)
+        # Built only when clicked, on Streamlit's download thread; nothing stays in the session
+        st.download_button(f"Download {fmt.upper()}", lambda: export_file(hh_id, kind, fmt),
+                           file_name=f"{kind}_{hh_id}.{fmt}", mime="text/csv" if fmt == 'csv' else "application/jsonl",
+                           use_container_width=True, on_click="ignore")
+        return
+
+    st.caption("Columns: " + ", ".join(BULK_FIELDS[kind]) + ". Re-upload the same file to resume an interrupted import.")
+    up = st.file_uploader("File", type=["csv", "jsonl", "json"])
+    if up and st.button("Import", use_container_width=True):
+        data = up.getvalue()
+        bar = st.progress(0.0, text="Importing…")
+        try:
+            total = max(count_rows(up.name, data), 1)
+            written, errors, resumed = import_rows(hh_id, kind, up.name, data,
+                                                   lambda done: bar.progress(min(done / total, 1.0), text=f"{done} rows"))
+        except (ValueError, UnicodeDecodeError, csv.Error) as e:
+            st.error(f"Could not read {up.name}: {e}"); return
+        bar.progress(1.0, text="Done")
+        household_stats.clear(); soon_items.clear(); invalidate_pantry_page()
+        st.success(f"Imported {written} rows" + (f" (resumed at row {resumed + 1})" if resumed else "") + ".")
+        if errors:
+            st.warning(f"{len(errors)} row(s) skipped" + (" (first 50 shown)" if len(errors) >= IMPORT_MAX_ERRORS else ""))
+            st.dataframe(errors, use_container_width=True, hide_index=True)
+
+# --- PANTRY BROWSER ---
+# Filters, ordering and prefix search run in Firestore; results come one page at a time
+# via start_after cursors, so the first screen costs one page of reads. The page is kept
+# in session state and patched by local writes, so plain reruns read nothing.
+PANTRY_PAGE_SIZE = 20
+PANTRY_PAGE_TTL = 60
+PANTRY_SORTS = {
+    "Name": ("name_norm", "ASCENDING"), "Expiring first": ("expiry_day", "ASCENDING"),
+    "Recently added": ("added_at", "DESCENDING"), "Lowest stock": ("quantity", "ASCENDING"),
+}
+EXPIRY_WINDOWS = {"Any expiry": None, "Expired": 0, "Within 7 days": 7, "Within 30 days": 30}
+
+def pantry_order(search="", window="Any expiry", sort="Name"):
+    """Sort keys of a pantry query; inequality fields have to lead the ordering."""
+    order = []
+    if normalize_name(search): order.append(('name_norm', 'ASCENDING'))
+    if EXPIRY_WINDOWS[window] is not None: order.append(('expiry_day', 'ASCENDING'))
+    field, direction = PANTRY_SORTS[sort]
+    if field not in [f for f, _ in order]: order.append((field, direction))
+    return order
+
+def pantry_indexes():
+    """Composite index fields for every filter/sort shape pantry_query can build.
+    firestore.indexes.json is written from this (python bench.py --write-indexes)."""
+    out = []
+    for category, store, search, window, sort in itertools.product(
+            (False, True), (False, True), ("", "x"), ("Any expiry", "Expired"), PANTRY_SORTS):
+        eq = ['household_id'] + ['category'] * category + ['suggested_store'] * store
+        fields = [(f, 'ASCENDING') for f in eq] + pantry_order(search, window, sort)
+        if fields not in out: out.append(fields)
+    return out
+
+def pantry_query(hh_id, search="", category="All", store="All", window="Any expiry", sort="Name"):
+    q = db.collection('inventory').where('household_id','==',hh_id)
+    if category != "All": q = q.where('category','==',category)
+    if store != "All": q = q.where('suggested_store','==',store)
+    prefix = normalize_name(search)
+    if prefix: q = q.where('name_norm','>=',prefix).where('name_norm','<',prefix + '\uf8ff')
+    days = EXPIRY_WINDOWS[window]
+    if days is not None:
+        today = datetime.date.today().toordinal()
+        if days == 0: q = q.where('expiry_day','<',today)
+        else: q = q.where('expiry_day','>=',today).where('expiry_day','<=',today + days)
+    for f, d in pantry_order(search, window, sort): q = q.order_by(f, direction=d)
+    return q
+
+def fetch_page(query, cursor=None, size=PANTRY_PAGE_SIZE):
+    """(documents, has_more) for one page; reads at most size + 1 documents."""
+    if cursor is not None: query = query.start_after(cursor)
+    docs = list(query.limit(size + 1).stream())
+    return docs[:size], len(docs) > size
 
 def page_pantry(hh_id):
-    st.markdown("## 📦 My Pantry")
+    h1, h2, h3 = st.columns([3, 1, 1])
+    h1.markdown("## 📦 My Pantry")
+    # Grid renders read-only tiles in one pass; Cards keeps edit widgets on every item.
+    view = h2.radio("View", ["Grid", "Cards"], key="pf_view", horizontal=True, label_visibility="collapsed")
+    if h3.button("⇅ Import / Export", use_container_width=True): bulk_dialog(hh_id)
     
-    try:
-        items = list(db.collection('inventory').where('household_id','==',hh_id).stream())
-        data = [{'id': i.id, **i.to_dict()} for i in items]
-    except: data = []
+    c1, c2, c3, c4, c5 = st.columns([3, 2, 2, 2, 2])
+    filters = dict(
+        search=c1.text_input("Search", placeholder="🔍 Search pantry", key="pf_search", label_visibility="collapsed"),
+        category=c2.selectbox("Category", ["All"] + CATEGORIES, key="pf_cat", label_visibility="collapsed"),
+        store=c3.selectbox("Store", ["All"] + STORES, key="pf_store", label_visibility="collapsed"),
+        window=c4.selectbox("Expiry", list(EXPIRY_WINDOWS), key="pf_exp", label_visibility="collapsed"),
+        sort=c5.selectbox("Sort", list(PANTRY_SORTS), key="pf_sort", label_visibility="collapsed"),
+    )
+    # Cursor stack: the last document of every page before the current one.
+    if st.session_state.get('pantry_filters') != filters:
+        st.session_state.pantry_filters = filters
+        st.session_state.pantry_cursors = [None]
+    cursors = st.session_state.pantry_cursors
     
-    if not data: st.info("Pantry is empty."); return
+    key = (tuple(filters.values()), len(cursors), cursors[-1] and cursors[-1].id)
+    cached = st.session_state.get('pantry_page')
+    stale = not cached or cached['key'] != key or time.monotonic() - cached['at'] > PANTRY_PAGE_TTL
+    # A page emptied by local deletes is read again rather than shown as empty.
+    if stale or (cached['last'] is not None and not st.session_state.get('pantry_items')):
+        try: docs, has_more = fetch_page(pantry_query(hh_id, **filters), cursors[-1])
+        except Exception as e:
+            st.error(f"Could not load pantry: {e}"); return
+        st.session_state.pantry_items = {d.id: {'id': d.id, **d.to_dict()} for d in docs}
+        cached = st.session_state.pantry_page = {'key': key, 'at': time.monotonic(), 'more': has_more,
+                                                 'last': docs[-1] if docs else None}
+    ids = list(st.session_state.pantry_items)
+    
+    if not ids:
+        unfiltered = not filters['search'] and filters['category'] == filters['store'] == "All" and EXPIRY_WINDOWS[filters['window']] is None
+        st.info("Pantry is empty." if unfiltered else "No items match.")
+        return
 
-    cols = st.columns(2) 
-    today = datetime.date.today()
+    if get_edit_buffer(hh_id).pending: edit_flusher()
+    if view == "Grid":
+        pantry_grid(hh_id, ids)
+    else:
+        cols = st.columns(2) 
+        for idx, doc_id in enumerate(ids):
+            with cols[idx % 2]:
+                pantry_card(hh_id, doc_id, idx)
     
-    for idx, item in enumerate(data):
-        color_class = f"card-bg-{idx % 5}"
-        
-        try: exp = datetime.datetime.strptime(item.get('estimated_expiry', ''), "%Y-%m-%d").date()
-        except: exp = today + datetime.timedelta(days=365)
-        
-        days_left = (exp - today).days
-        if days_left < 0: badge = "🔴 Expired"
-        elif days_left < 7: badge = f"🟠 {days_left}d left"
-        else: badge = f"🟢 {days_left}d left"
-
-        # LOGIC: Auto-Add to Shopping List
-        curr = float(item.get('quantity', 0))
-        thresh = float(item.get('threshold', 1))
+    p1, p2, p3 = st.columns([1, 2, 1])
+    if len(cursors) > 1: p1.button("← Prev", use_container_width=True, on_click=cursors.pop)
+    p2.markdown(f"<p style='text-align:center;'>Page {len(cursors)}</p>", unsafe_allow_html=True)
+    if cached['more']: p3.button("Next →", use_container_width=True, on_click=cursors.append, args=(cached['last'],))
+
+def rerun_card():
+    # A card edit normally arrives as a fragment rerun; fall back to a full rerun otherwise.
+    try: st.rerun(scope="fragment")
+    except st.errors.StreamlitAPIException: st.rerun()
+
+def card_view(item, days_left=math.inf):
+    """Display values shared by the card and the grid tile; text fields are HTML-escaped."""
+    exp_day = item.get('expiry_day')
+    if exp_day is None: exp_day = expiry_fields(item.get('estimated_expiry'))['expiry_day']
+    curr = float(item.get('quantity', 0))
+    init = float(item.get('initial_quantity', curr)) or 1.0
+    return {
+        'badge': html.escape(expiry_badge(exp_day)),
+        'icon': get_smart_icon(item.get('item_name', ''), item.get('category', 'General')),
+        'name': html.escape(str(item.get('item_name', 'Unknown'))),
+        'category': html.escape(str(item.get('category', 'General'))),
+        'curr': curr, 'init': init, 'fill': min(curr / init, 1.0), 'runout': runout_label(days_left),
+    }
+
+PANTRY_TILE = string.Template(
+    '<div class="pantry-card card-bg-$color"><div><div class="status-badge">$badge</div></div>'
+    '<div style="font-size: 3rem; margin-bottom:10px;">$icon</div>'
+    '<div style="font-size: 1.1rem; font-weight: 700; line-height: 1.2;">$name</div>'
+    '<div style="font-size: 0.85rem; opacity: 0.8;">$category</div>'
+    '<div style="font-size: 0.8rem; opacity: 0.8;">$runout</div>'
+    '<div class="tile-qty">$curr / $init</div><div class="tile-bar"><div style="width: $pct%;"></div></div></div>'
+)
+
+def pantry_grid_html(items):
+    tiles = []
+    days, _ = forecast_runout(items)
+    for idx, item in enumerate(items):
+        v = card_view(item, days[idx])
+        tiles.append(PANTRY_TILE.substitute(v, color=idx % 5, curr=f"{v['curr']:g}", init=f"{v['init']:g}",
+                                            pct=round(v['fill'] * 100)))
+    return '<div class="pantry-grid">' + "".join(tiles) + '</div>'
+
+@st.fragment
+def pantry_grid(hh_id, item_ids):
+    """The page as one HTML block; edit widgets exist only for the selected item."""
+    buf = get_edit_buffer(hh_id)
+    items = [i for i in (buf.view(st.session_state.pantry_items.get(x)) for x in item_ids) if i is not None]
+    st.markdown(pantry_grid_html(items), unsafe_allow_html=True)
+    names = {i['id']: i.get('item_name', 'Unknown') for i in items}
+    sel = st.selectbox("Edit item", list(names), index=None, format_func=names.get, key="pf_edit",
+                       placeholder="✏️ Pick an item to edit", label_visibility="collapsed")
+    if sel in names:
+        with st.container(border=True):
+            card_editor(hh_id, next(i for i in items if i['id'] == sel), buf)
+
+def card_editor(hh_id, item, buf):
+    """Count / initial / weight / alert inputs and Delete for one item. Edits are staged in the
+    write-behind buffer and rerun the enclosing fragment."""
+    curr = float(item.get('quantity', 0))
+    init = float(item.get('initial_quantity', curr)) or 1.0
+    thresh = float(item.get('threshold', 1))
+    nc = st.number_input("Count", 0.0, value=curr, key=f"q_{item['id']}")
+    ni = st.number_input("Initial Qty", 0.0, value=init, key=f"i_{item['id']}")
+    nw = st.number_input("Weight", 0.0, value=float(item.get('weight', 0)), key=f"w_{item['id']}")
+    nt = st.number_input("Alert Limit", 0.0, value=thresh, key=f"t_{item['id']}")
+    
+    updates = {}
+    if nc != curr: updates['quantity'] = nc
+    if ni != init: updates['initial_quantity'] = ni
+    if nw != float(item.get('weight', 0)): updates['weight'] = nw
+    if nt != thresh: updates['threshold'] = nt
+    
+    # Staged, not written: the buffer coalesces edits and handles the auto-refill on flush
+    if updates:
+        delta = updates.pop('quantity', curr) - curr
+        first = not buf.pending
+        buf.stage(item['id'], updates, delta)
+        # The first pending edit reruns the page so it mounts the flusher
+        if first: st.rerun()
+        rerun_card()
+    
+    if st.button("Delete", key=f"d_{item['id']}"):
+        buf.discard(item['id'])
+        db.collection('inventory').document(item['id']).delete()
+        patch_local(hh_id, 'inventory', item['id'])
+        rerun_card()
+
+@st.fragment
+def pantry_card(hh_id, item_id, idx):
+    """One pantry card; edits rerun only this fragment and read the patched item back from the page."""
+    buf = get_edit_buffer(hh_id)
+    item = buf.view(st.session_state.pantry_items.get(item_id))
+    if item is None: return
+    v = card_view(item, forecast_runout([item])[0][0])
+    
+    with st.container():
+        st.markdown(f"""
+        <div class="pantry-card card-bg-{idx % 5}">
+            <div class="status-badge">{v['badge']}</div>
+            <div style="font-size: 3rem; margin-bottom:10px;">{v['icon']}</div>
+            <div style="font-size: 1.1rem; font-weight: 700; line-height: 1.2;">
+                {v['name']}
+            </div>
+            <div style="font-size: 0.85rem; opacity: 0.8; margin-bottom: 10px;">
+                {v['category']}
+            </div>
+            <div style="font-size: 0.8rem; opacity: 0.8;">{v['runout']}</div>
+        </div>
+        """, unsafe_allow_html=True)
         
-        # Smart icon logic
-        icon = get_smart_icon(item.get('item_name', ''), item.get('category', 'General'))
+        st.progress(v['fill'])
         
-        with cols[idx % 2]:
-            with st.container():
-                st.markdown(f"""
-                <div class="pantry-card {color_class}">
-                    <div class="status-badge">{badge}</div>
-                    <div style="font-size: 3rem; margin-bottom:10px;">{icon}</div>
-                    <div style="font-size: 1.1rem; font-weight: 700; line-height: 1.2;">
-                        {item.get('item_name', 'Unknown')}
-                    </div>
-                    <div style="font-size: 0.85rem; opacity: 0.8; margin-bottom: 10px;">
-                        {item.get('category', 'General')}
-                    </div>
-                </div>
-                """, unsafe_allow_html=True)
-                
-                init = float(item.get('initial_quantity', curr)) or 1.0
-                st.progress(min(curr/init, 1.0))
-                
-                with st.expander(f"Edit ({curr})"):
-                    nc = st.number_input("Count", 0.0, value=curr, key=f"q_{item['id']}")
-                    ni = st.number_input("Initial Qty", 0.0, value=init, key=f"i_{item['id']}")
-                    nw = st.number_input("Weight", 0.0, value=float(item.get('weight', 0)), key=f"w_{item['id']}")
-                    nt = st.number_input("Alert Limit", 0.0, value=float(item.get('threshold', 1)), key=f"t_{item['id']}")
-                    
-                    updates = {}
-                    if nc != curr: updates['quantity'] = nc
-                    if ni != init: updates['initial_quantity'] = ni
-                    if nw != float(item.get('weight', 0)): updates['weight'] = nw
-                    if nt != float(item.get('threshold', 1)): updates['threshold'] = nt
-                    
-                    # Auto-Refill Logic if Threshold breached
-                    if updates:
-                        # If quantity dropped below threshold
-                        if 'quantity' in updates and updates['quantity'] < float(item.get('threshold', 1)):
-                            needed = max(1.0, float(item.get('threshold', 1)) - updates['quantity'])
-                            db.collection('shopping_list').add({
-                                "item_name": item['item_name'], "household_id": hh_id,
-                                "store": item.get('suggested_store', 'General'), "qty_needed": needed,
-                                "status": "Pending", "reason": "Auto-Refill"
-                            })
-                            st.toast(f"🚨 Added to List")
-
-                        db.collection('inventory').document(item['id']).update(updates)
-                        st.rerun()
-                    
-                    if st.button("Delete", key=f"d_{item['id']}"):
-                        db.collection('inventory').document(item['id']).delete()
-                        st.rerun()
+        with st.expander(f"Edit ({v['curr']})"):
+            card_editor(hh_id, item, buf)
+
+LIST_READ_ERRORS = (TimeoutError, gexc.GoogleAPICallError, gexc.RetryError)
+
+def list_entries(hh_id):
+    """Pending list entries from the household replica. When it cannot sync, or Firestore
+    errors, they are read directly this once; None if that fails too."""
+    try: return get_replica(hh_id).items('shopping_list')
+    except LIST_READ_ERRORS:
+        logging.getLogger("kitchen_mind").warning("shopping_list replica for %s unavailable", hh_id, exc_info=True)
+    try: return [{'id': d.id, **d.to_dict()} for d in REPLICA_QUERIES['shopping_list'](hh_id).stream()]
+    except LIST_READ_ERRORS:
+        logging.getLogger("kitchen_mind").exception("Could not read the shopping list of %s", hh_id)
+        return None
 
 def page_list(hh_id):
     st.markdown("## 🛒 List")
+    replica = get_replica(hh_id)
     
     with st.container(border=True):
         with st.form("ql"):
@@ -572,22 +2832,34 @@ def page_list(hh_id):
             txt = c1.text_input("Item Name")
             qty = c2.number_input("Qty", 1.0, step=1.0)
             if c3.form_submit_button("Add", use_container_width=True) and txt:
-                db.collection('shopping_list').add({
-                    "item_name": txt, 
-                    "household_id": hh_id, 
-                    "qty_needed": qty, 
-                    "status": "Pending",
-                    "store": "General"
-                })
+                replica.apply('shopping_list', *add_to_list(hh_id, txt, qty))
                 st.rerun()
+        with st.form("quick_add_list", clear_on_submit=True):
+            lines = st.text_area("Quick add", key="qa_list", height=80, label_visibility="collapsed",
+                                 placeholder="Several at once: 2 lbs chicken, dozen eggs, 3 x yogurt")
+            if st.form_submit_button("➕ Add all", use_container_width=True) and lines.strip():
+                # A list entry only needs a name and amount, so unknown items need no AI either
+                items, unknown = parse_quick_add(lines)
+                rows = merge_voice_items([items, filter(None, map(parse_line, unknown))])
+                for r in rows: replica.apply('shopping_list', *add_to_list(hh_id, r['item_name'], r['quantity']))
+                skipped = [l for l in unknown if parse_line(l) is None]
+                if skipped: st.toast(f"Couldn't read: {', '.join(skipped)}", icon="🤔")
             
-    items = list(db.collection('shopping_list').where('household_id','==',hh_id).where('status','==','Pending').stream())
+    data = list_entries(hh_id)
+    if data is None:
+        st.error("The list could not be loaded. Please try again in a moment.")
+        return
+    
+    if st.toggle("🧾 Recently bought", key="list_history"):
+        for h in recent_purchases(hh_id):
+            when = h.get('bought_at')
+            st.caption(f"{h.get('item_name', '')} × {float(h.get('qty_needed', 1)):g}"
+                       + (f" · {when:%b %d}" if hasattr(when, 'strftime') else ""))
     
-    if not items: 
+    if not data: 
         st.info("Your list is empty! Great job.")
         return
     
-    data = [{'id': x.id, **x.to_dict()} for x in items]
     stores = list(set([d.get('store', 'General') for d in data]))
     
     for s in stores:
@@ -598,15 +2870,18 @@ def page_list(hh_id):
             with st.container(border=True):
                 c1, c2 = st.columns([1, 5])
                 if c1.button("✓", key=i['id'], use_container_width=True):
-                    db.collection('shopping_list').document(i['id']).update({'status': 'Bought'})
+                    restocked = purchase_entry(hh_id, i['id'])
+                    replica.discard('shopping_list', i['id'])
+                    if restocked: patch_local(hh_id, 'inventory', *restocked)
                     st.rerun()
                 
                 icon = get_smart_icon(i['item_name'], "General")
                 qty_show = float(i.get('qty_needed', 1))
                 q_str = f"{int(qty_show)}" if qty_show.is_integer() else f"{qty_show}"
                 
-                c2.markdown(f"<div style='font-size:1.1rem;'>{icon} <strong>{i['item_name']}</strong></div>", unsafe_allow_html=True)
+                c2.markdown(f"<div style='font-size:1.1rem;'>{icon} <strong>{html.escape(str(i['item_name']))}</strong></div>", unsafe_allow_html=True)
                 c2.caption(f"Buy: {q_str}")
 
 if __name__ == "__main__":
-    main()
+    with rerun_metrics():
+        main()
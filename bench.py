@@ -0,0 +1,644 @@
+"""Offline benchmark for app.py.
+
+Drives the real pages through streamlit.testing.v1.AppTest against an in-memory fake of the
+Firestore surface the app uses, with Gemini swapped for app.FakeModel. Reports wall time,
+document reads/writes and widget count for every rerun, and fails when a metric regresses
+against the stored baseline, when exporting a household and importing the file back
+changes its document count, or when firestore.indexes.json lacks an index a pantry query needs.
+Unit tests live in tests/ (python -m pytest tests) and reach app.py through in_app.
+
+    python bench.py                              # compare against bench_baseline.json
+    python bench.py --households 5 --items 500   # bigger seed
+    python bench.py --update-baseline            # accept the current numbers
+    python bench.py --storage sqlite             # same scenarios on the embedded SQLite store
+    python bench.py --conformance                # storage behaviour checks on every backend
+    python bench.py --write-indexes              # regenerate the pantry indexes in firestore.indexes.json
+"""
+import argparse
+import collections
+import base64
+import datetime
+import functools
+import hashlib
+import io
+import json
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+import types
+import uuid
+
+from google.api_core import exceptions
+from google.cloud.firestore_v1 import transforms
+from google.cloud.firestore_v1.watch import ChangeType
+
+APP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+INDEXES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "firestore.indexes.json")
+
+# --- IN-MEMORY FIRESTORE ---
+class Counters:
+    def __init__(self): self.reset()
+    def reset(self): self.reads = 0; self.writes = 0
+
+COUNTERS = Counters()
+
+def _resolve(old, value):
+    if isinstance(value, transforms.Increment): return (old or 0) + value.value
+    if value is transforms.SERVER_TIMESTAMP: return datetime.datetime.now(datetime.timezone.utc)
+    return value
+
+class FakeSnapshot:
+    def __init__(self, ref, data):
+        self.reference, self.id, self._data = ref, ref.id, data
+        self.exists = data is not None
+    def to_dict(self): return dict(self._data) if self._data is not None else None
+    def get(self, field): return (self._data or {}).get(field)
+
+class FakeDocument:
+    def __init__(self, db, collection, doc_id):
+        self._db, self._collection, self.id = db, collection, doc_id
+    @property
+    def _table(self): return self._db.data[self._collection]
+    def get(self, transaction=None):
+        COUNTERS.reads += 1
+        data = self._table.get(self.id)
+        return FakeSnapshot(self, dict(data) if data is not None else None)
+    def set(self, data, merge=False):
+        COUNTERS.writes += 1
+        doc = dict(self._table.get(self.id) or {}) if merge else {}
+        for k, v in data.items(): doc[k] = _resolve(doc.get(k), v)
+        self._table[self.id] = doc
+        self._db.notify(self._collection)
+    def create(self, data):
+        if self.id in self._table: raise exceptions.AlreadyExists(f"Document already exists: {self._collection}/{self.id}")
+        self.set(data)
+    def update(self, data):
+        COUNTERS.writes += 1
+        if self.id not in self._table: raise exceptions.NotFound(f"No document to update: {self._collection}/{self.id}")
+        doc = self._table[self.id]
+        for k, v in data.items(): doc[k] = _resolve(doc.get(k), v)
+        self._db.notify(self._collection)
+    def delete(self):
+        COUNTERS.writes += 1
+        self._table.pop(self.id, None)
+        self._db.notify(self._collection)
+
+_OPS = {
+    '==': lambda a, b: a == b, '!=': lambda a, b: a != b, 'in': lambda a, b: a in b,
+    '<': lambda a, b: a is not None and a < b, '<=': lambda a, b: a is not None and a <= b,
+    '>': lambda a, b: a is not None and a > b, '>=': lambda a, b: a is not None and a >= b,
+}
+
+class FakeQuery:
+    def __init__(self, db, collection, filters=(), order=(), limit=None, after=None):
+        self._db, self._collection = db, collection
+        self._filters, self._order, self._limit, self._after = list(filters), list(order), limit, after
+
+    def _copy(self, **changes):
+        state = dict(filters=self._filters, order=self._order, limit=self._limit, after=self._after)
+        state.update(changes)
+        return FakeQuery(self._db, self._collection, **state)
+
+    def where(self, field=None, op=None, value=None, filter=None):
+        if filter is not None: field, op, value = filter.field_path, filter.op_string, filter.value
+        return self._copy(filters=self._filters + [(field, op, value)])
+    def order_by(self, field, direction="ASCENDING"): return self._copy(order=self._order + [(field, direction)])
+    def limit(self, n): return self._copy(limit=n)
+    def start_after(self, snapshot): return self._copy(after=snapshot)
+
+    def _rows(self):
+        rows = [(k, v) for k, v in self._db.data[self._collection].items()
+                if all(_OPS[op](v.get(f), val) for f, op, val in self._filters)]
+        # Like Firestore, ordering on a field drops documents that do not have it.
+        rows = [(k, v) for k, v in rows if all(f in v for f, _ in self._order)]
+        rows.sort(key=lambda kv: kv[0])
+        for field, direction in reversed(self._order):
+            rows.sort(key=lambda kv: kv[1][field], reverse=(direction == "DESCENDING"))
+        if self._after is not None:
+            ids = [k for k, _ in rows]
+            rows = rows[ids.index(self._after.id) + 1:] if self._after.id in ids else []
+        return rows[:self._limit] if self._limit is not None else rows
+
+    def stream(self, transaction=None):
+        rows = self._rows()
+        COUNTERS.reads += len(rows)
+        for k, v in rows: yield FakeSnapshot(FakeDocument(self._db, self._collection, k), dict(v))
+    def get(self, transaction=None): return list(self.stream())
+    def count(self, alias=None): return FakeAggregation(self).count(alias)
+    def sum(self, field, alias=None): return FakeAggregation(self).sum(field, alias)
+
+    def on_snapshot(self, callback):
+        watch = FakeWatch(self, callback)
+        self._db.watches.append(watch)
+        watch.fire()
+        return watch
+
+class FakeCollection(FakeQuery):
+    def __init__(self, db, name): super().__init__(db, name)
+    def document(self, doc_id=None): return FakeDocument(self._db, self._collection, doc_id or uuid.uuid4().hex[:20])
+    def add(self, data):
+        ref = self.document()
+        ref.set(data)
+        return None, ref
+
+class FakeAggregation:
+    def __init__(self, query): self._query, self._specs = query, []
+    def count(self, alias=None): self._specs.append(('count', None, alias)); return self
+    def sum(self, field, alias=None): self._specs.append(('sum', field, alias)); return self
+    def get(self, transaction=None):
+        rows = self._query._rows()
+        COUNTERS.reads += max(1, -(-len(rows) // 1000))   # one read per 1,000 index entries
+        results = []
+        for kind, field, alias in self._specs:
+            value = len(rows) if kind == 'count' else sum(float(v.get(field) or 0) for _, v in rows)
+            results.append(types.SimpleNamespace(alias=alias, value=value))
+        return [results]
+
+class FakeWatch:
+    def __init__(self, query, callback):
+        self._query, self._callback, self._seen, self.is_active = query, callback, None, True
+    def fire(self):
+        rows = dict(self._query._rows())
+        seen, changes = self._seen or {}, []
+        doc = lambda k, v: FakeSnapshot(FakeDocument(self._query._db, self._query._collection, k), dict(v))
+        for k, v in rows.items():
+            if k not in seen: changes.append(types.SimpleNamespace(type=ChangeType.ADDED, document=doc(k, v)))
+            elif seen[k] != v: changes.append(types.SimpleNamespace(type=ChangeType.MODIFIED, document=doc(k, v)))
+        changes += [types.SimpleNamespace(type=ChangeType.REMOVED, document=doc(k, v)) for k, v in seen.items() if k not in rows]
+        first, self._seen = self._seen is None, {k: dict(v) for k, v in rows.items()}
+        COUNTERS.reads += len(changes)
+        if changes or first: self._callback([], changes, None)
+    def unsubscribe(self): self.is_active = False
+
+class FakeBatch:
+    """WriteBatch and Transaction in one: writes are queued and applied on commit."""
+    def __init__(self): self._ops = []
+    def set(self, ref, data, merge=False): self._ops.append(lambda: ref.set(data, merge=merge))
+    def create(self, ref, data): self._ops.append(lambda: ref.create(data))
+    def update(self, ref, data): self._ops.append(lambda: ref.update(data))
+    def delete(self, ref): self._ops.append(ref.delete)
+    def commit(self):
+        ops, self._ops = self._ops, []
+        for op in ops: op()
+        return []
+    def run(self, fn, *args, **kwargs):
+        """Transaction.run as in sqlite_store: writes are dropped if fn raises."""
+        try: result = fn(self, *args, **kwargs)
+        except BaseException:
+            self._ops = []; raise
+        self.commit()
+        return result
+
+class FakeFirestore:
+    def __init__(self):
+        self.data = collections.defaultdict(dict)
+        self.watches = []
+        self._lock = threading.RLock()
+    def collection(self, name): return FakeCollection(self, name)
+    def batch(self): return FakeBatch()
+    def transaction(self, **kwargs): return FakeBatch()
+    def get_all(self, refs, transaction=None):
+        for ref in refs: yield ref.get()
+    def notify(self, collection):
+        with self._lock:
+            for w in self.watches:
+                if w.is_active and w._query._collection == collection: w.fire()
+
+# --- SEED DATA ---
+NAMES = ["Milk", "Eggs", "Bread", "Bananas", "Apples", "Chicken Breast", "Ground Beef", "Rice", "Pasta",
+         "Cheddar", "Greek Yogurt", "Coffee", "Green Tea", "Orange Juice", "Carrots", "Broccoli", "Onions",
+         "Garlic", "Tomatoes", "Potatoes", "Avocados", "Salmon", "Peanut Butter", "Olive Oil", "Cereal"]
+CATEGORIES = ["Produce", "Dairy", "Meat", "Pantry", "Frozen", "Spices", "Beverages", "Household"]
+STORES = ["General", "Costco", "Whole Foods", "Trader Joe's"]
+
+@functools.lru_cache(maxsize=None)
+def password_hash(password):
+    """Same 'scrypt$n$r$p$salt$hash' format and default cost as app.hash_password; one fixed
+    salt so every seeded user can share the (slow) hash."""
+    b64 = lambda raw: base64.urlsafe_b64encode(raw).rstrip(b'=').decode()
+    salt = b"kitchen-mind-bench"
+    digest = hashlib.scrypt(password.encode(), salt=salt, n=2 ** 14, r=8, p=1, maxmem=2 ** 25, dklen=32)
+    return f"scrypt${2 ** 14}$8$1${b64(salt)}${b64(digest)}"
+
+def seed_docs(households, items, list_entries, rng):
+    """(collection, id, data) for every seeded document."""
+    today = datetime.date.today()
+    for h in range(households):
+        hh_id = f"HH{h:03d}"
+        # Seeded as an up-to-date household, so the one-off data migrations have nothing to do.
+        yield 'households', hh_id, {"name": f"Home {h}", "id": hh_id, "list_compacted": True, "search_backfilled": True,
+                                    "expiry_backfilled": True, "low_stock_backfilled": True, "list_archived_day": today.toordinal(), "forecast_day": today.toordinal()}
+        yield 'users', f"user{h}@bench.test", {"email": f"user{h}@bench.test", "password_hash": password_hash("pw"),
+                                                "household_id": hh_id}
+        for i in range(items):
+            name = f"{rng.choice(NAMES)} {i}"
+            expiry = today + datetime.timedelta(days=rng.randint(-10, 200))
+            qty, threshold = float(rng.randint(0, 6)), float(rng.randint(1, 2))
+            yield 'inventory', f"{hh_id}-inv{i:05d}", {
+                "item_name": name, "category": rng.choice(CATEGORIES), "quantity": qty, "initial_quantity": 6.0,
+                "weight": 0.0, "weight_unit": "count", "threshold": threshold,
+                "estimated_expiry": str(expiry), "suggested_store": rng.choice(STORES), "notes": "", "barcode": "",
+                "household_id": hh_id, "added_at": datetime.datetime(2026, 1, 1) + datetime.timedelta(minutes=i),
+                "name_norm": name.lower(), "expiry_day": expiry.toordinal(), "low_stock": qty < threshold,
+            }
+        for i in range(list_entries):
+            yield 'shopping_list', f"{hh_id}-list{i:05d}", {
+                "item_name": f"{rng.choice(NAMES)} {i}", "household_id": hh_id, "qty_needed": 1.0,
+                "status": "Pending", "store": rng.choice(STORES),
+            }
+
+def seed(db, households, items, list_entries, rng):
+    if isinstance(db, FakeFirestore):
+        for collection, doc_id, data in seed_docs(households, items, list_entries, rng): db.data[collection][doc_id] = data
+        return
+    batch = db.batch()
+    for collection, doc_id, data in seed_docs(households, items, list_entries, rng):
+        batch.set(db.collection(collection).document(doc_id), data)
+    batch.commit()
+
+# --- SCENARIOS ---
+# Each scenario is a list of (step name, action) pairs; every action ends in a rerun.
+def _nav(page): return lambda at: at.radio(key="nav").set_value(page).run()
+
+def _scan_image():
+    """A capture as the app keeps it: JPEG bytes capped at 1280 px (from a phone-camera frame)."""
+    from PIL import Image
+    img = Image.new("RGB", (3024, 4032), (200, 120, 80))
+    img.thumbnail((1280, 1280))
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", quality=85)
+    return buf.getvalue()
+
+_run = lambda at: at.run()
+
+def _await_jobs(at, timeout=60):
+    """Rerun until the session's background AI jobs have been collected."""
+    deadline = time.monotonic() + timeout
+    while at.session_state["ai_jobs"] and time.monotonic() < deadline:
+        time.sleep(0.05)
+        at.run()
+    return at
+
+# Scenario -> (page it opens on, steps)
+SCENARIOS = {
+    "login": (None, [
+        ("render", _run),
+        ("submit", lambda at: (at.text_input[0].set_value("user0@bench.test"), at.text_input[1].set_value("pw"),
+                               at.button[0].click(), at.run())[-1]),
+        # A reload: session state is gone, only the signed token in the URL is left; its
+        # version is checked with one user lookup
+        ("reconnect", lambda at: (at.session_state.__setitem__("user_info", None), at.run())[-1]),
+    ]),
+    "home": ("🏠 Home", [
+        ("render", _run),
+        ("rerun", _run),
+        # Parsed locally, no AI job: every line is in the shelf-life table
+        ("quick_add", lambda at: (at.text_area(key="qa_home").set_value("2 lbs chicken, dozen eggs, 3 x yogurt"),
+                                  next(b for b in at.button if "Add to Pantry" in b.label).click(), at.run())[-1]),
+    ]),
+    "pantry": ("📦 Pantry", [
+        ("first_page", _run),
+        ("rerun", _run),
+        ("next_page", lambda at: next(b for b in at.button if b.label == "Next →").click().run()),
+        ("select_item", lambda at: at.selectbox(key="pf_edit").set_value(next(iter(at.session_state.pantry_items))).run()),
+        ("edit_card", lambda at: at.number_input[0].increment().run()),
+        ("leave", _nav("🛒 List")),
+    ]),
+    "list": ("🛒 List", [
+        ("render", _run),
+        ("check_item", lambda at: next(b for b in at.button if b.label == "✓").click().run()),
+    ]),
+    "voice": ("🎤 Voice", [("review", _run)]),
+    "scanner": ("📸 Scan", [
+        ("render", _run),
+        ("analyze", lambda at: next(b for b in at.button if "Analyze" in b.label).click().run()),
+        ("results", _await_jobs),
+    ]),
+}
+
+def _session(name, at):
+    """Session state each scenario starts from."""
+    page = SCENARIOS[name][0]
+    if page is None: return
+    at.session_state.user_info = {"email": "user0@bench.test", "household_id": "HH000"}
+    at.session_state.nav = page
+    if name == "voice":
+        at.session_state.voice_data = [{"item_name": n, "quantity": 1, "category": "Pantry"} for n in NAMES]
+    if name == "scanner":
+        at.session_state.imgs = {'f': _scan_image(), 'b': _scan_image(), 'd': None}
+
+def count_widgets(at):
+    from streamlit.testing.v1.element_tree import Widget
+    count, stack = 0, [at._tree]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, Widget): count += 1
+        stack.extend(getattr(node, "children", {}).values())
+    return count
+
+def run_scenario(name, db, repeats):
+    import streamlit as st
+    from streamlit.testing.v1 import AppTest
+    results = collections.defaultdict(lambda: {"seconds": [], "reads": 0, "writes": 0, "widgets": 0})
+    for _ in range(repeats):
+        st.cache_data.clear(); st.cache_resource.clear()
+        if isinstance(db, FakeFirestore): db.watches.clear()
+        at = AppTest.from_file(APP, default_timeout=60)
+        at.secrets["GEMINI_API_KEY"] = "bench"
+        _session(name, at)
+        for step, action in SCENARIOS[name][1]:
+            COUNTERS.reset()
+            t0 = time.perf_counter()
+            at = action(at)
+            elapsed = time.perf_counter() - t0
+            if at.exception: raise RuntimeError(f"{name}:{step} raised {at.exception[0].value}")
+            r = results[f"{name}:{step}"]
+            r["seconds"].append(elapsed)
+            r["reads"], r["writes"], r["widgets"] = COUNTERS.reads, COUNTERS.writes, count_widgets(at)
+    return {k: {**v, "seconds": statistics.median(v["seconds"])} for k, v in results.items()}
+
+# --- APP HARNESS ---
+# app.py reads st.secrets and caches resources at import, so it is imported inside an AppTest
+# script run. The bench checks and tests/ call into it through in_app.
+def _app_script():
+    import sys
+    import streamlit as st
+    sys.path.insert(0, st.session_state.app_dir)
+    import app
+    st.session_state.result = st.session_state.call(app)
+
+def in_app(call, timeout=120):
+    """call(app) inside a script run, on whatever storage firebase/KITCHEN_MIND_STORAGE points at."""
+    from streamlit.testing.v1 import AppTest
+    at = AppTest.from_function(_app_script, default_timeout=timeout)
+    at.secrets["GEMINI_API_KEY"] = "bench"
+    at.session_state.app_dir = os.path.dirname(APP)
+    at.session_state.call = call
+    at.run()
+    if at.exception: raise RuntimeError(at.exception[0].value)
+    return at.session_state.result
+
+# --- EXPORT / IMPORT ROUND TRIP ---
+# Exporting a household and importing the file back must update the same documents.
+def _roundtrip(app):
+    results = []
+    for kind in ("inventory", "shopping_list"):
+        for fmt in ("csv", "jsonl"):
+            with app.export_file("HH000", kind, fmt) as f: data = f.read()
+            written, errors, _ = app.import_rows("HH000", kind, f"export.{fmt}", data)
+            results.append((kind, fmt, app.count_rows(f"export.{fmt}", data), written, len(errors)))
+    return results
+
+def run_roundtrip(db):
+    """Failure messages for an export -> import round trip on the seeded data."""
+    count = lambda kind: sum(1 for d in db.data[kind].values() if d.get("household_id") == "HH000")
+    before = {k: count(k) for k in ("inventory", "shopping_list")}
+    try: results = in_app(_roundtrip)
+    except RuntimeError as e: return [f"roundtrip raised {e}"]
+    failures = []
+    for kind, fmt, exported, written, errors in results:
+        if not (exported == written == before[kind]) or errors:
+            failures.append(f"roundtrip {kind}.{fmt}: {before[kind]} docs, exported {exported}, "
+                            f"imported {written}, {errors} errors")
+    after = {k: count(k) for k in before}
+    if after != before: failures.append(f"roundtrip duplicated documents: {before} -> {after}")
+    return failures
+
+# --- INDEX COVERAGE ---
+# Every filter/sort shape pantry_query builds needs a composite index in firestore.indexes.json.
+def pantry_indexes():
+    return [[tuple(f) for f in fields] for fields in in_app(lambda app: app.pantry_indexes())]
+
+def _index_fields(index):
+    return [(f["fieldPath"], f["order"]) for f in index["fields"]]
+
+def run_index_check(path=INDEXES):
+    """Failure messages for pantry query shapes without a composite index."""
+    with open(path) as f: have = {tuple(_index_fields(i)) for i in json.load(f)["indexes"] if i["collectionGroup"] == "inventory"}
+    return [f"missing inventory index {', '.join(f'{f} {d}' for f, d in fields)}"
+            for fields in pantry_indexes() if tuple(fields) not in have]
+
+def write_indexes(path=INDEXES):
+    """Rewrite the pantry indexes from app.pantry_indexes(), keeping every other entry."""
+    with open(path) as f: spec = json.load(f)
+    needed = pantry_indexes()
+    pantry = [{"collectionGroup": "inventory", "queryScope": "COLLECTION",
+               "fields": [{"fieldPath": f, "order": d} for f, d in fields]} for fields in needed]
+    # Earlier pantry shapes are recognised by their leading household_id + filter fields.
+    shape = lambda i: i["collectionGroup"] == "inventory" and any(f["fieldPath"] in ("name_norm", "expiry_day", "added_at", "quantity") for f in i["fields"])
+    spec["indexes"] = pantry + [i for i in spec["indexes"] if not shape(i)]
+    with open(path, "w") as f: json.dump(spec, f, indent=2)
+    return len(pantry)
+
+# --- STORAGE CONFORMANCE ---
+# Behavioural checks every storage backend has to pass, run against the in-memory
+# Firestore model above, the embedded SQLite store and, when FIRESTORE_EMULATOR_HOST is
+# set, the Firestore emulator (python bench.py --conformance, or pytest tests/).
+def _conformance_checks(db):
+    from firebase_admin import firestore
+    from sqlite_store import transactional
+    inv = db.collection('inventory')
+    today = 740000
+    for i in range(7):
+        inv.document(f"d{i}").set({"household_id": "H1" if i < 6 else "H2", "item_name": f"Item {i}", "name_norm": f"item {i}",
+                                  "quantity": float(i), "expiry_day": today + i, "low_stock": i % 2 == 0, "category": "Dairy"})
+    inv.document("nofield").set({"household_id": "H1", "item_name": "Loose"})
+    mine = inv.where('household_id', '==', 'H1')
+    ids = lambda docs: [d.id for d in docs]
+
+    yield "get missing", not inv.document("nope").get().exists
+    yield "get existing", inv.document("d1").get().to_dict()["item_name"] == "Item 1"
+    yield "equality filter", sorted(ids(mine.stream())) == ["d0", "d1", "d2", "d3", "d4", "d5", "nofield"]
+    yield "boolean filter", sorted(ids(mine.where('low_stock', '==', True).stream())) == ["d0", "d2", "d4"]
+    yield "range filter", ids(mine.where('expiry_day', '>=', today + 2).where('expiry_day', '<=', today + 3)
+                              .order_by('expiry_day').stream()) == ["d2", "d3"]
+    yield "prefix search", ids(mine.where('name_norm', '>=', 'item 1').where('name_norm', '<', 'item 1\uf8ff')
+                               .order_by('name_norm').stream()) == ["d1"]
+    yield "order drops missing field", "nofield" not in ids(mine.order_by('quantity').stream())
+    yield "descending order", ids(mine.order_by('quantity', direction='DESCENDING').limit(2).stream()) == ["d5", "d4"]
+
+    pages, cursor, q = [], None, mine.order_by('quantity')
+    while True:
+        page = list((q.start_after(cursor) if cursor else q).limit(2).stream())
+        if not page: break
+        pages.append(ids(page)); cursor = page[-1]
+    yield "cursor pagination", pages == [["d0", "d1"], ["d2", "d3"], ["d4", "d5"]]
+
+    agg = {r.alias: r.value for row in mine.count(alias='n').sum('quantity', alias='units').get() for r in row}
+    yield "count and sum", agg == {"n": 7, "units": 15}
+
+    inv.document("d1").update({"quantity": firestore.Increment(2), "notes": "x"})
+    d1 = inv.document("d1").get().to_dict()
+    yield "update with increment", d1["quantity"] == 3 and d1["notes"] == "x" and d1["item_name"] == "Item 1"
+    inv.document("d1").set({"threshold": 1.0}, merge=True)
+    yield "merge set", inv.document("d1").get().to_dict().get("item_name") == "Item 1"
+    inv.document("d1").set({"item_name": "Replaced"})
+    yield "plain set replaces", inv.document("d1").get().to_dict() == {"item_name": "Replaced"}
+    try: inv.document("d1").create({"item_name": "Twin"}); created = True
+    except exceptions.AlreadyExists: created = False
+    yield "create refuses existing", not created and inv.document("d1").get().to_dict() == {"item_name": "Replaced"}
+
+    _, ref = db.collection('shopping_list').add({"household_id": "H1", "status": "Pending", "added_at": firestore.SERVER_TIMESTAMP})
+    stamp = ref.get().to_dict()["added_at"]
+    yield "add with server timestamp", isinstance(stamp, datetime.datetime)
+
+    batch = db.batch()
+    batch.set(inv.document("b1"), {"household_id": "H3", "quantity": 1.0})
+    batch.set(inv.document("b2"), {"household_id": "H3", "quantity": 2.0})
+    batch.delete(inv.document("d0"))
+    batch.commit()
+    yield "batch commit", len(list(inv.where('household_id', '==', 'H3').stream())) == 2 and not inv.document("d0").get().exists
+    yield "get_all", [s.exists for s in db.get_all([inv.document("b1"), inv.document("zz")])] == [True, False]
+
+    @transactional
+    def bump(transaction, ref, fail=False):
+        qty = ref.get(transaction=transaction).to_dict()["quantity"]
+        transaction.update(ref, {"quantity": qty + 10})
+        if fail: raise ValueError("abandoned")
+        return qty + 10
+    yield "transaction", bump(db.transaction(), inv.document("b1")) == 11 and inv.document("b1").get().to_dict()["quantity"] == 11
+    try: bump(db.transaction(), inv.document("b1"), fail=True)
+    except ValueError: pass
+    yield "transaction rolls back", inv.document("b1").get().to_dict()["quantity"] == 11
+
+    events = []
+    def settle(n, timeout=10):
+        # The emulator delivers changes on its own thread; the local stores call back inline.
+        end = time.monotonic() + timeout
+        while len(events) < n and time.monotonic() < end: time.sleep(0.02)
+    watch = db.collection('shopping_list').where('household_id', '==', 'H9').where('status', '==', 'Pending').on_snapshot(
+        lambda docs, changes, read_time: events.extend((c.type.name, c.document.id) for c in changes))
+    lst = db.collection('shopping_list')
+    lst.document("w1").set({"household_id": "H9", "status": "Pending"}); settle(1)
+    lst.document("w1").update({"qty_needed": 2}); settle(2)
+    lst.document("w1").update({"status": "Bought"}); settle(3)
+    lst.document("w2").set({"household_id": "H8", "status": "Pending"})
+    watch.unsubscribe()
+    yield "snapshot listener", events == [("ADDED", "w1"), ("MODIFIED", "w1"), ("REMOVED", "w1")]
+
+STORAGE_BACKENDS = ("firestore-model", "sqlite", "emulator")
+
+def emulator_client():
+    """A client on the (emptied) emulator at FIRESTORE_EMULATOR_HOST, or None when unset."""
+    host = os.environ.get("FIRESTORE_EMULATOR_HOST")
+    if not host: return None
+    import urllib.request
+    from google.cloud import firestore as cloud_firestore
+    project = os.environ.get("GCLOUD_PROJECT", "kitchen-mind-test")
+    url = f"http://{host}/emulator/v1/projects/{project}/databases/(default)/documents"
+    urllib.request.urlopen(urllib.request.Request(url, method="DELETE"), timeout=10).close()
+    return cloud_firestore.Client(project=project)
+
+def storage_backend(name, tmp):
+    """A fresh store for one of STORAGE_BACKENDS; None if it is not available here."""
+    if name == "firestore-model": return FakeFirestore()
+    if name == "sqlite":
+        import sqlite_store
+        return sqlite_store.SqliteStore(os.path.join(tmp, "conformance.db"))
+    return emulator_client()
+
+def run_conformance():
+    import tempfile
+    failures, tmp = 0, tempfile.mkdtemp(prefix="kitchen_mind_bench_")
+    for backend in STORAGE_BACKENDS:
+        db = storage_backend(backend, tmp)
+        if db is None:
+            print(f"{backend:<16}skipped (FIRESTORE_EMULATOR_HOST is not set)")
+            continue
+        for name, ok in _conformance_checks(db):
+            print(f"{backend:<16}{name:<28}{'ok' if ok else 'FAIL'}")
+            failures += not ok
+    return 1 if failures else 0
+
+# --- REPORT ---
+def compare(results, baseline, tolerance, time_tolerance):
+    """Regression messages for every metric above its baseline (time only if time_tolerance is set)."""
+    failures = []
+    for step, m in results.items():
+        base = baseline.get(step)
+        if not base: continue
+        for metric in ("reads", "writes", "widgets"):
+            if m[metric] > base[metric] * (1 + tolerance) + 1:
+                failures.append(f"{step}: {metric} {m[metric]} > baseline {base[metric]}")
+        if time_tolerance is not None and m["seconds"] > base["seconds"] * (1 + time_tolerance):
+            failures.append(f"{step}: {m['seconds']*1000:.0f} ms > baseline {base['seconds']*1000:.0f} ms")
+    return failures
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--households", type=int, default=3)
+    parser.add_argument("--items", type=int, default=200, help="inventory items per household")
+    parser.add_argument("--list", type=int, default=40, help="pending list entries per household")
+    parser.add_argument("--repeats", type=int, default=3, help="runs per scenario; wall time is the median")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS), help="run only these (repeatable)")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed growth of reads/writes/widgets")
+    parser.add_argument("--time-tolerance", type=float, default=None, help="also fail on wall time growth, e.g. 0.5")
+    parser.add_argument("--storage", choices=["firestore", "sqlite"], default="firestore",
+                        help="backend under test; reads/writes are only counted on the Firestore model")
+    parser.add_argument("--conformance", action="store_true", help="run the storage backend checks instead")
+    parser.add_argument("--write-indexes", action="store_true", help="regenerate the pantry indexes and exit")
+    args = parser.parse_args(argv)
+    if args.conformance: return run_conformance()
+    if args.write_indexes:
+        import firebase_admin.firestore
+        db = FakeFirestore()
+        firebase_admin.firestore.client = lambda *a, **k: db
+        print(f"Wrote {write_indexes()} pantry indexes to {INDEXES}")
+        return 0
+
+    os.environ["KITCHEN_MIND_FAKE_AI"] = "1"
+    results, checks = {}, []
+    if args.storage == "sqlite":
+        import tempfile
+        import sqlite_store
+        tmp = tempfile.mkdtemp(prefix="kitchen_mind_bench_")
+        for name in args.scenario or SCENARIOS:
+            path = os.path.join(tmp, f"{name}.db")
+            seed(sqlite_store.SqliteStore(path), args.households, args.items, args.list, random.Random(args.seed))
+            os.environ["KITCHEN_MIND_STORAGE"] = f"sqlite:{path}"
+            results.update(run_scenario(name, None, args.repeats))
+    else:
+        db = FakeFirestore()
+        seed(db, args.households, args.items, args.list, random.Random(args.seed))
+        import firebase_admin.firestore
+        firebase_admin.firestore.client = lambda *a, **k: db
+        for name in args.scenario or SCENARIOS:
+            # Each scenario starts from the same seeded data.
+            snapshot = {c: {k: dict(v) for k, v in t.items()} for c, t in db.data.items()}
+            results.update(run_scenario(name, db, args.repeats))
+            db.data = collections.defaultdict(dict, snapshot)
+        checks = run_roundtrip(db)
+    checks += run_index_check()
+
+    for f in checks: print(f"CHECK FAILED {f}")
+    print(f"{'step':<22}{'ms':>9}{'reads':>8}{'writes':>8}{'widgets':>9}")
+    for step, m in results.items():
+        print(f"{step:<22}{m['seconds']*1000:>9.1f}{m['reads']:>8}{m['writes']:>8}{m['widgets']:>9}")
+
+    config = {"households": args.households, "items": args.items, "list": args.list}
+    if args.storage != "firestore": config["storage"] = args.storage
+    if args.update_baseline:
+        with open(args.baseline, "w") as f: json.dump({"config": config, "steps": results}, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+        return 1 if checks else 0
+    try:
+        with open(args.baseline) as f: baseline = json.load(f)
+    except OSError:
+        print("No baseline yet; run with --update-baseline to record one.")
+        return 1 if checks else 0
+    if baseline.get("config") != config:
+        print(f"Baseline was recorded with {baseline.get('config')}; not comparing.")
+        return 1 if checks else 0
+    failures = compare(results, baseline["steps"], args.tolerance, args.time_tolerance)
+    for f in failures: print(f"REGRESSION {f}")
+    return 1 if failures or checks else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
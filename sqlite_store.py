@@ -0,0 +1,449 @@
+"""Embedded SQLite storage for single-node installs and offline development.
+
+SqliteStore answers the slice of the Firestore client API that app.py uses (collections,
+documents, filtered/ordered/paged queries, count/sum aggregations, batches, transactions,
+get_all and snapshot listeners), so the app selects a backend once and the rest of the code
+is unchanged. Documents are JSON rows in one table; the fields the app filters and sorts
+on are covered by expression indexes. The database runs in WAL mode with one connection
+per thread, so readers never wait on the writer.
+
+Listeners are notified from in-process writes only, which is exactly right for one server
+process and why this backend is meant for single-node deployments.
+"""
+import datetime
+import functools
+import json
+import os
+import re
+import sqlite3
+import threading
+import types
+import uuid
+
+from google.api_core import exceptions
+from google.cloud import firestore
+from google.cloud.firestore_v1 import transforms
+from google.cloud.firestore_v1.watch import ChangeType
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS docs (
+    collection TEXT NOT NULL,
+    id TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (collection, id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS docs_household ON docs(collection, json_extract(data, '$.household_id'), json_extract(data, '$.status'), json_extract(data, '$.store'));
+CREATE INDEX IF NOT EXISTS docs_expiry ON docs(collection, json_extract(data, '$.household_id'), json_extract(data, '$.expiry_day'));
+CREATE INDEX IF NOT EXISTS docs_name ON docs(collection, json_extract(data, '$.household_id'), json_extract(data, '$.name_norm'));
+CREATE INDEX IF NOT EXISTS docs_added ON docs(collection, json_extract(data, '$.household_id'), json_extract(data, '$.added_at'));
+CREATE INDEX IF NOT EXISTS docs_low ON docs(collection, json_extract(data, '$.household_id'), json_extract(data, '$.low_stock'));
+CREATE INDEX IF NOT EXISTS docs_barcode ON docs(collection, json_extract(data, '$.household_id'), json_extract(data, '$.barcode'));
+CREATE INDEX IF NOT EXISTS docs_email ON docs(collection, json_extract(data, '$.email'));
+"""
+FIELD_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+OPS = {'==': '=', '!=': '!=', '<': '<', '<=': '<=', '>': '>', '>=': '>='}
+TS_KEY = "__datetime__"
+
+# --- ENCODING ---
+# Timestamps are stored as {"__datetime__": iso}; a fixed-width UTC iso string keeps them
+# ordered the same way in SQL as in Python.
+def _encode(value):
+    if isinstance(value, datetime.datetime):
+        if value.tzinfo is None: value = value.replace(tzinfo=datetime.timezone.utc)
+        return {TS_KEY: value.astimezone(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f+00:00")}
+    if isinstance(value, dict): return {k: _encode(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)): return [_encode(v) for v in value]
+    return value
+
+def _decode_hook(obj):
+    if len(obj) == 1 and TS_KEY in obj: return datetime.datetime.fromisoformat(obj[TS_KEY])
+    return obj
+
+def dumps(data): return json.dumps(_encode(data), separators=(',', ':'))
+def loads(text): return json.loads(text, object_hook=_decode_hook)
+
+def _sql_value(value):
+    """A Python value as the SQL value `json_extract(data, '$.field')` yields for it."""
+    value = _encode(value)
+    if isinstance(value, (dict, list)): return json.dumps(value, separators=(',', ':'))
+    if isinstance(value, bool): return int(value)
+    return value
+
+def _field(name):
+    if not FIELD_RE.match(name): raise ValueError(f"Unsupported field path: {name!r}")
+    return f"json_extract(data, '$.{name}')"
+
+def _resolve(old, value):
+    if isinstance(value, transforms.Increment): return (old or 0) + value.value
+    if value is transforms.SERVER_TIMESTAMP: return datetime.datetime.now(datetime.timezone.utc)
+    return value
+
+def _apply(current, fields, merge=True):
+    doc = dict(current or {}) if merge else {}
+    for k, v in fields.items():
+        if v is transforms.DELETE_FIELD: doc.pop(k, None)
+        else: doc[k] = _resolve(doc.get(k), v)
+    return doc
+
+# --- DOCUMENTS ---
+class DocumentSnapshot:
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.id = reference.id
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self): return dict(self._data) if self._data is not None else None
+    def get(self, field): return (self._data or {}).get(field)
+
+class DocumentReference:
+    def __init__(self, store, collection, doc_id):
+        self._store = store
+        self._collection = collection
+        self.id = doc_id
+
+    @property
+    def path(self): return f"{self._collection}/{self.id}"
+
+    def get(self, transaction=None):
+        row = self._store._execute("SELECT data FROM docs WHERE collection = ? AND id = ?",
+                                   (self._collection, self.id)).fetchone()
+        return DocumentSnapshot(self, loads(row[0]) if row else None)
+
+    def set(self, data, merge=False):
+        batch = self._store.batch(); batch.set(self, data, merge=merge); batch.commit()
+
+    def create(self, data):
+        batch = self._store.batch(); batch.create(self, data); batch.commit()
+
+    def update(self, data):
+        batch = self._store.batch(); batch.update(self, data); batch.commit()
+
+    def delete(self):
+        batch = self._store.batch(); batch.delete(self); batch.commit()
+
+# --- QUERIES ---
+class Query:
+    ASCENDING = "ASCENDING"
+    DESCENDING = "DESCENDING"
+
+    def __init__(self, store, collection, filters=(), orders=(), limit=None, after=None):
+        self._store = store
+        self._collection = collection
+        self._filters = tuple(filters)
+        self._orders = tuple(orders)
+        self._limit = limit
+        self._after = after
+
+    def _copy(self, **changes):
+        args = dict(filters=self._filters, orders=self._orders, limit=self._limit, after=self._after)
+        args.update(changes)
+        return Query(self._store, self._collection, **args)
+
+    def where(self, field_path=None, op_string=None, value=None, filter=None):
+        if filter is not None: field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        if op_string not in OPS and op_string not in ('in', 'not-in'):
+            raise ValueError(f"Unsupported operator: {op_string!r}")
+        _field(field_path)
+        return self._copy(filters=self._filters + ((field_path, op_string, value),))
+
+    def order_by(self, field_path, direction=ASCENDING):
+        _field(field_path)
+        return self._copy(orders=self._orders + ((field_path, direction),))
+
+    def limit(self, count): return self._copy(limit=count)
+    def start_after(self, snapshot): return self._copy(after=snapshot)
+
+    def _where(self, ids=None):
+        clauses, params = ["collection = ?"], [self._collection]
+        for field, op, value in self._filters:
+            col = _field(field)
+            if op in ('in', 'not-in'):
+                values = [_sql_value(v) for v in value]
+                clauses.append(f"{col} {'IN' if op == 'in' else 'NOT IN'} ({', '.join('?' * len(values))})")
+                params += values
+            else:
+                clauses.append(f"{col} {OPS[op]} ?"); params.append(_sql_value(value))
+        # Like Firestore, ordering on a field leaves out documents that lack it.
+        for field, _ in self._orders:
+            clauses.append(f"json_type(data, '$.{field}') IS NOT NULL")
+        if self._after is not None:
+            clause, cursor_params = self._cursor_clause(self._after)
+            clauses.append(clause); params += cursor_params
+        if ids is not None:
+            clauses.append(f"id IN ({', '.join('?' * len(ids))})"); params += list(ids)
+        return " AND ".join(clauses), params
+
+    def _order_terms(self):
+        terms = [(_field(f), d) for f, d in self._orders]
+        return terms + [("id", self._orders[-1][1] if self._orders else self.ASCENDING)]
+
+    def _cursor_clause(self, snapshot):
+        """Rows strictly after `snapshot` in this query's order, document id breaking ties."""
+        values = [_sql_value(snapshot.get(f)) for f, _ in self._orders] + [snapshot.id]
+        ors, params = [], []
+        terms = self._order_terms()
+        for i, (col, direction) in enumerate(terms):
+            ands = [f"{c} = ?" for c, _ in terms[:i]]
+            ands.append(f"{col} {'<' if direction == self.DESCENDING else '>'} ?")
+            ors.append("(" + " AND ".join(ands) + ")")
+            params += values[:i] + [values[i]]
+        return "(" + " OR ".join(ors) + ")", params
+
+    def _sql(self, columns="id, data", ids=None):
+        where, params = self._where(ids)
+        sql = f"SELECT {columns} FROM docs WHERE {where}"
+        if columns == "id, data":
+            sql += " ORDER BY " + ", ".join(f"{c} {'DESC' if d == self.DESCENDING else 'ASC'}" for c, d in self._order_terms())
+            if self._limit is not None:
+                sql += " LIMIT ?"; params.append(self._limit)
+        return sql, params
+
+    def stream(self, transaction=None):
+        for doc_id, data in self._store._execute(*self._sql()).fetchall():
+            yield DocumentSnapshot(DocumentReference(self._store, self._collection, doc_id), loads(data))
+
+    def get(self, transaction=None): return list(self.stream())
+
+    def count(self, alias=None): return AggregationQuery(self).count(alias=alias)
+    def sum(self, field_path, alias=None): return AggregationQuery(self).sum(field_path, alias=alias)
+    def avg(self, field_path, alias=None): return AggregationQuery(self).avg(field_path, alias=alias)
+
+    def on_snapshot(self, callback): return self._store._watch(self, callback)
+
+class CollectionReference(Query):
+    def __init__(self, store, name):
+        super().__init__(store, name)
+        self.id = name
+
+    def document(self, document_id=None):
+        return DocumentReference(self._store, self._collection, document_id or uuid.uuid4().hex[:20])
+
+    def add(self, document_data, document_id=None):
+        ref = self.document(document_id)
+        ref.create(document_data)
+        return datetime.datetime.now(datetime.timezone.utc), ref
+
+    def list_documents(self):
+        rows = self._store._execute("SELECT id FROM docs WHERE collection = ?", (self._collection,)).fetchall()
+        return [self.document(r[0]) for r in rows]
+
+class AggregationQuery:
+    FUNCS = {'count': "COUNT(*)", 'sum': "TOTAL({})", 'avg': "AVG({})"}
+
+    def __init__(self, query):
+        self._query = query
+        self._aggs = []
+
+    def _add(self, kind, field_path, alias):
+        col = _field(field_path) if field_path else None
+        self._aggs.append((kind, col, alias or f"field_{len(self._aggs) + 1}"))
+        return self
+
+    def count(self, alias=None): return self._add('count', None, alias)
+    def sum(self, field_path, alias=None): return self._add('sum', field_path, alias)
+    def avg(self, field_path, alias=None): return self._add('avg', field_path, alias)
+
+    def get(self, transaction=None):
+        columns = ", ".join(self.FUNCS[kind].format(col) for kind, col, _ in self._aggs)
+        sql, params = self._query._copy(orders=(), limit=None, after=None)._sql(columns)
+        row = self._query._store._execute(sql, params).fetchone()
+        results = []
+        for (kind, _, alias), value in zip(self._aggs, row):
+            if kind == 'sum' and float(value).is_integer(): value = int(value)
+            results.append(types.SimpleNamespace(alias=alias, value=value))
+        return [results]
+
+# --- WRITES ---
+class WriteBatch:
+    """Buffered writes applied in one SQLite transaction."""
+    def __init__(self, store):
+        self._store = store
+        self._writes = []
+
+    def _add(self, kind, ref, data=None, merge=False):
+        self._writes.append((kind, ref, data, merge))
+        return self
+
+    def set(self, reference, document_data, merge=False): return self._add('set', reference, document_data, merge)
+    def create(self, reference, document_data): return self._add('create', reference, document_data)
+    def update(self, reference, field_updates): return self._add('update', reference, field_updates)
+    def delete(self, reference): return self._add('delete', reference)
+
+    @property
+    def _write_pbs(self): return self._writes
+
+    def commit(self):
+        writes, self._writes = self._writes, []
+        with self._store._write_lock:
+            self._store._apply(writes)
+        self._store._notify(writes)
+        return [types.SimpleNamespace(update_time=None) for _ in writes]
+
+class Transaction(WriteBatch):
+    """Serializable read-modify-write: `run` holds the process write lock and an IMMEDIATE
+    SQLite transaction while the function reads and stages writes, then commits them."""
+    def __init__(self, store):
+        super().__init__(store)
+        self.in_progress = False
+
+    def run(self, fn, *args, **kwargs):
+        """fn(self, *args, **kwargs), its writes committed if it returns and dropped if it raises.
+        SQLite has one writer at a time, so unlike Firestore there is no conflict to retry."""
+        self._store._write_lock.acquire()
+        self._store._conn().execute("BEGIN IMMEDIATE")
+        self.in_progress = True
+        try:
+            result = fn(self, *args, **kwargs)
+            writes, self._writes = self._writes, []
+            self._store._apply(writes, own_transaction=False)
+        except BaseException:
+            self._writes = []
+            self._finish("ROLLBACK"); raise
+        self._finish("COMMIT")
+        self._store._notify(writes)
+        return result
+
+    def _finish(self, sql):
+        try: self._store._conn().execute(sql)
+        finally:
+            self.in_progress = False
+            self._store._write_lock.release()
+
+    def get(self, ref_or_query):
+        if isinstance(ref_or_query, DocumentReference): return iter([ref_or_query.get(transaction=self)])
+        return ref_or_query.stream(transaction=self)
+
+    def get_all(self, references): return self._store.get_all(references, transaction=self)
+
+def transactional(fn):
+    """The app's transaction decorator, for every backend. Stores that run transactions themselves
+    (this one, the bench's in-memory model) have `transaction.run`; a Firestore client transaction
+    goes through google.cloud.firestore.transactional, which retries on contention."""
+    on_firestore = firestore.transactional(fn)
+    @functools.wraps(fn)
+    def call(transaction, *args, **kwargs):
+        if hasattr(transaction, 'run'): return transaction.run(fn, *args, **kwargs)
+        return on_firestore(transaction, *args, **kwargs)
+    return call
+
+# --- LISTENERS ---
+class Watch:
+    """In-process snapshot listener: re-reads only the documents a commit touched."""
+    def __init__(self, store, query, callback):
+        self._store = store
+        self._query = query
+        self._callback = callback
+        self._seen = {}
+        self._lock = threading.Lock()
+        self.is_active = True
+
+    def _deliver(self, rows, ids=None):
+        changes = []
+        with self._lock:
+            keys = set(rows) | (set(self._seen) if ids is None else set(ids) & set(self._seen))
+            for doc_id in keys:
+                ref = DocumentReference(self._store, self._query._collection, doc_id)
+                if doc_id not in rows:
+                    changes.append(types.SimpleNamespace(type=ChangeType.REMOVED, document=DocumentSnapshot(ref, self._seen.pop(doc_id))))
+                elif self._seen.get(doc_id) != rows[doc_id]:
+                    kind = ChangeType.MODIFIED if doc_id in self._seen else ChangeType.ADDED
+                    self._seen[doc_id] = rows[doc_id]
+                    changes.append(types.SimpleNamespace(type=kind, document=DocumentSnapshot(ref, rows[doc_id])))
+        if changes or ids is None:
+            docs = [DocumentSnapshot(DocumentReference(self._store, self._query._collection, k), v) for k, v in self._seen.items()]
+            self._callback(docs, changes, datetime.datetime.now(datetime.timezone.utc))
+
+    def refresh(self, ids=None):
+        if not self.is_active: return
+        sql, params = self._query._sql(ids=ids)
+        self._deliver({doc_id: loads(data) for doc_id, data in self._store._execute(sql, params).fetchall()}, ids)
+
+    def unsubscribe(self):
+        self.is_active = False
+        self._store._unwatch(self)
+
+# --- STORE ---
+class SqliteStore:
+    """Firestore-compatible client backed by one SQLite file."""
+    def __init__(self, path="kitchen_mind.db"):
+        self.path = os.path.abspath(path)
+        self._local = threading.local()
+        self._write_lock = threading.RLock()
+        self._watches = []
+        self._watch_lock = threading.Lock()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        # Without statistics the planner picks the primary key over the expression indexes;
+        # a bounded ANALYZE on open keeps them current at a few milliseconds' cost.
+        conn.execute("PRAGMA analysis_limit=1000")
+        conn.execute("ANALYZE")
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # Autocommit mode: transactions are opened explicitly; statements are cached per connection.
+            conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False,
+                                   cached_statements=256, timeout=30)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _execute(self, sql, params=()):
+        return self._conn().execute(sql, params)
+
+    def _apply(self, writes, own_transaction=True):
+        conn = self._conn()
+        if own_transaction: conn.execute("BEGIN IMMEDIATE")
+        try:
+            for kind, ref, data, merge in writes:
+                key = (ref._collection, ref.id)
+                if kind == 'delete':
+                    conn.execute("DELETE FROM docs WHERE collection = ? AND id = ?", key)
+                    continue
+                row = conn.execute("SELECT data FROM docs WHERE collection = ? AND id = ?", key).fetchone()
+                current = loads(row[0]) if row else None
+                if kind == 'create' and current is not None: raise exceptions.AlreadyExists(f"Document already exists: {ref.path}")
+                if kind == 'update' and current is None: raise exceptions.NotFound(f"No document to update: {ref.path}")
+                doc = _apply(current, data, merge=merge or kind == 'update')
+                conn.execute("INSERT OR REPLACE INTO docs (collection, id, data) VALUES (?, ?, ?)", (*key, dumps(doc)))
+            if own_transaction: conn.execute("COMMIT")
+        except BaseException:
+            if own_transaction: conn.execute("ROLLBACK")
+            raise
+
+    # Firestore client surface
+    def collection(self, name): return CollectionReference(self, name)
+    def document(self, path): return DocumentReference(self, *path.split('/', 1))
+    def batch(self): return WriteBatch(self)
+    def transaction(self, max_attempts=5, read_only=False): return Transaction(self)
+
+    def get_all(self, references, field_paths=None, transaction=None):
+        for ref in references: yield ref.get(transaction=transaction)
+
+    def collections(self):
+        return [self.collection(r[0]) for r in self._execute("SELECT DISTINCT collection FROM docs").fetchall()]
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None: conn.close(); self._local.conn = None
+
+    # Listeners
+    def _watch(self, query, callback):
+        watch = Watch(self, query, callback)
+        with self._watch_lock: self._watches.append(watch)
+        watch.refresh()
+        return watch
+
+    def _unwatch(self, watch):
+        with self._watch_lock:
+            if watch in self._watches: self._watches.remove(watch)
+
+    def _notify(self, writes):
+        touched = {}
+        for _, ref, _, _ in writes: touched.setdefault(ref._collection, set()).add(ref.id)
+        with self._watch_lock: watches = list(self._watches)
+        for watch in watches:
+            ids = touched.get(watch._query._collection)
+            if ids: watch.refresh(ids)
@@ -0,0 +1,16 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import bench
+
+@pytest.fixture(scope="session")
+def app():
+    """app.py imported on the bench's in-memory Firestore, with the fake model."""
+    import firebase_admin.firestore
+    db = bench.FakeFirestore()
+    firebase_admin.firestore.client = lambda *a, **k: db
+    os.environ["KITCHEN_MIND_FAKE_AI"] = "1"
+    return bench.in_app(lambda app: app)
@@ -0,0 +1,21 @@
+"""classify_item: whole-word vocabulary matches, the head noun winning."""
+import pytest
+
+@pytest.mark.parametrize("name,canonical,category", [
+    ("pineapple", "Pineapple", "Produce"),
+    ("Apple", "Apple", "Produce"),
+    ("apple juice", "Apple Juice", "Beverages"),
+    ("toilet paper roll", "Toilet Paper", "Household"),
+    ("dinner roll", "Dinner Roll", "Pantry"),
+])
+def test_classify_item(app, name, canonical, category):
+    c = app.classify_item(name)
+    assert (c.canonical, c.category) == (canonical, category)
+
+def test_teapot_is_not_tea(app):
+    c = app.classify_item("teapot")
+    assert c.category is None and c.canonical == "teapot" and c.icon != app.classify_item("tea").icon
+
+def test_unknown_item_keeps_given_category(app):
+    c = app.classify_item("mystery jar", "Pantry")
+    assert (c.canonical, c.category, c.shelf_life) == ("mystery jar", "Pantry", app.CATEGORY_SHELF_LIFE["Pantry"])
@@ -0,0 +1,27 @@
+"""Write-behind pantry edits: plain field edits share one batch, a deleted item drops only its own edit."""
+
+def seed(app, *doc_ids):
+    for doc_id in doc_ids:
+        app.db.collection('inventory').document(doc_id).set({"household_id": "HE", "item_name": doc_id, "quantity": 1.0})
+
+def test_plain_edits_commit_in_one_batch(app, monkeypatch):
+    seed(app, "e1", "e2")
+    batches = []
+    batch = app.db.batch
+    monkeypatch.setattr(app.db, "batch", lambda: batches.append(1) or batch())
+    buf = app.EditBuffer("HE")
+    buf.stage("e1", {"notes": "top shelf"})
+    buf.stage("e2", {"suggested_store": "Aldi"})
+    buf.flush()
+    assert len(batches) == 1 and not buf.pending
+    assert app.db.collection('inventory').document("e2").get().to_dict()["suggested_store"] == "Aldi"
+
+def test_deleted_item_falls_back_to_single_updates(app):
+    seed(app, "e3")
+    buf = app.EditBuffer("HE")
+    buf.stage("gone", {"notes": "x"})
+    buf.stage("e3", {"notes": "kept"})
+    buf.flush()
+    assert not buf.pending
+    assert app.db.collection('inventory').document("e3").get().to_dict()["notes"] == "kept"
+    assert not app.db.collection('inventory').document("gone").get().exists
@@ -0,0 +1,22 @@
+"""Household migrations and clean-ups back off after a failure instead of retrying every rerun."""
+
+def test_failed_task_backs_off(app):
+    calls = []
+    def fail():
+        calls.append(1)
+        raise RuntimeError("missing index")
+    app.run_household_task("HB", "forecast_day", fail)
+    app.run_household_task("HB", "forecast_day", fail)
+    assert len(calls) == 1
+    backoff = app.household_task_backoff()
+    retry_at, failures = backoff[("HB", "forecast_day")]
+    assert failures == 1
+    backoff[("HB", "forecast_day")] = (0.0, failures)
+    app.run_household_task("HB", "forecast_day", fail)
+    assert len(calls) == 2 and backoff[("HB", "forecast_day")][1] == 2
+
+def test_success_clears_backoff(app):
+    backoff = app.household_task_backoff()
+    backoff[("HC", "list_compacted")] = (0.0, 3)
+    app.run_household_task("HC", "list_compacted", lambda: None)
+    assert ("HC", "list_compacted") not in backoff
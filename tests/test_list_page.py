@@ -0,0 +1,22 @@
+"""The list page's read path when the household replica cannot be used."""
+import pytest
+from google.api_core import exceptions as gexc
+
+class BrokenReplica:
+    def __init__(self, error): self.error = error
+    def items(self, name): raise self.error
+
+@pytest.mark.parametrize("error", [TimeoutError("did not sync"), gexc.PermissionDenied("listen denied"),
+                                   gexc.RetryError("gave up", None)])
+def test_falls_back_to_a_direct_query(app, monkeypatch, error):
+    lst = app.db.collection('shopping_list')
+    lst.document("l1").set({"household_id": "HL", "status": "Pending", "item_name": "Milk"})
+    lst.document("l2").set({"household_id": "HL", "status": "Bought", "item_name": "Eggs"})
+    monkeypatch.setattr(app, "get_replica", lambda hh_id: BrokenReplica(error))
+    assert [(e["id"], e["item_name"]) for e in app.list_entries("HL")] == [("l1", "Milk")]
+
+def test_none_when_the_direct_query_fails_too(app, monkeypatch):
+    monkeypatch.setattr(app, "get_replica", lambda hh_id: BrokenReplica(gexc.ServiceUnavailable("down")))
+    def unavailable(hh_id): raise gexc.ServiceUnavailable("down")
+    monkeypatch.setitem(app.REPLICA_QUERIES, "shopping_list", unavailable)
+    assert app.list_entries("HL") is None
@@ -0,0 +1,17 @@
+"""extract_json_list: the item list inside whatever the model wrapped it in."""
+import pytest
+
+@pytest.mark.parametrize("reply,names", [
+    ('[{"item_name": "Milk"}, {"item_name": "Eggs"}]', ["Milk", "Eggs"]),
+    ('```json\n[{"item_name": "Milk"}]\n```', ["Milk"]),
+    ('Sure! Here you go: [{"item_name": "Milk"}] Enjoy.', ["Milk"]),
+    ('{"item_name": "Milk", "tags": ["dairy"]}', ["Milk"]),
+    ('{"items": [{"item_name": "Milk"}, {"item_name": "Eggs"}]}', ["Milk", "Eggs"]),
+    ('```json\n{"results": []}\n```', []),
+])
+def test_extract_json_list(app, reply, names):
+    assert [d["item_name"] for d in app.extract_json_list(reply)] == names
+
+@pytest.mark.parametrize("reply", ['{"items": [{"item_name": "Milk"}], "note": "one item"}', "no items here"])
+def test_unusable_reply_is_rejected(app, reply):
+    with pytest.raises(ValueError): app.extract_json_list(reply)
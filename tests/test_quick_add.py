@@ -0,0 +1,35 @@
+"""Quick-add parser: typed lines and what parse_line must read from them."""
+import pytest
+
+PARSE_CASES = [
+    ("2 lbs chicken", {"item_name": "Chicken", "quantity": 1.0, "weight": 2.0, "weight_unit": "lbs"}),
+    ("1 lb chicken", {"item_name": "Chicken", "quantity": 1.0, "weight": 1.0, "weight_unit": "lbs"}),
+    ("500g pasta", {"item_name": "Pasta", "quantity": 1.0, "weight": 500.0, "weight_unit": "g"}),
+    ("1 500g pasta", {"item_name": "Pasta", "quantity": 1.0, "weight": 500.0, "weight_unit": "g"}),
+    ("12 oz coffee", {"item_name": "Coffee", "quantity": 1.0, "weight": 12.0, "weight_unit": "oz"}),
+    ("1,5 kg rice", {"item_name": "Rice", "quantity": 1.0, "weight": 1.5, "weight_unit": "kg"}),
+    ("rice 2kg", {"item_name": "Rice", "quantity": 1.0, "weight": 2.0, "weight_unit": "kg"}),
+    ("dozen eggs", {"item_name": "Eggs", "quantity": 12.0}),
+    ("half dozen eggs", {"item_name": "Eggs", "quantity": 6.0}),
+    ("3 x yogurt", {"item_name": "Yogurt", "quantity": 3.0}),
+    ("milk x2", {"item_name": "Milk", "quantity": 2.0}),
+    ("3 cans of tomatoes", {"item_name": "Tomatoes", "quantity": 3.0}),
+    ("half and half", {"item_name": "Half And Half", "quantity": 1.0}),
+    ("2 x 500g pasta", {"item_name": "Pasta", "quantity": 2.0, "weight": 500.0, "weight_unit": "g"}),
+    ("2 × 1.5 l water", {"item_name": "Water", "quantity": 2.0, "weight": 1.5, "weight_unit": "L"}),
+    ("a 12 oz bag of coffee", {"item_name": "Coffee", "quantity": 1.0, "weight": 12.0, "weight_unit": "oz"}),
+    ("2", None),
+]
+
+@pytest.mark.parametrize("line,expected", PARSE_CASES)
+def test_parse_line(app, line, expected):
+    assert app.parse_line(line) == expected
+
+def test_decimal_comma_does_not_split_lines(app):
+    items, unknown = app.parse_quick_add("1,5 kg rice, 2 x yogurt,1,000 g flour")
+    assert [(i["item_name"], i["quantity"], i.get("weight")) for i in items] == [
+        ("Rice", 1.0, 1.5), ("Yogurt", 2.0, None), ("Flour", 1.0, 1000.0)] and not unknown
+
+def test_roll_needs_food_context(app):
+    items, unknown = app.parse_quick_add("toilet paper roll, 6 dinner rolls")
+    assert [(i["item_name"], i["category"]) for i in items] == [("Toilet Paper Roll", "Household"), ("Dinner Rolls", "Pantry")]
@@ -0,0 +1,22 @@
+"""Scanner review rows -> inventory documents."""
+
+def editor_rows(*rows):
+    # st.data_editor gives every row every column, None where a row had no value
+    cols = {k for r in rows for k in r}
+    return [{k: r.get(k) for k in cols} for r in rows]
+
+def test_mixed_template_and_ai_rows(app):
+    template = {"item_name": "Oat Milk", "category": "Dairy", "weight": 1.0, "weight_unit": "L",
+                "suggested_store": "Costco", "threshold": 2.0, "quantity": 1.0, "barcode": "0123"}
+    ai = {"item_name": "Pineapple", "quantity": 1, "category": "Produce", "estimated_expiry": "2026-10-25"}
+    docs = [app.scanned_item("H1", r) for r in editor_rows(template, ai)]
+    assert docs[0]["low_stock"] is True and docs[0]["threshold"] == 2.0
+    assert docs[1]["low_stock"] is False and "threshold" not in docs[1] and "barcode" not in docs[1]
+    assert all(d["household_id"] == "H1" and None not in d.values() for d in docs)
+
+def test_blank_quantity_row(app):
+    doc = app.scanned_item("H1", {"item_name": "Rice", "quantity": None, "threshold": None})
+    assert doc["quantity"] == doc["initial_quantity"] == 1.0 and doc["low_stock"] is False
+
+def test_derived_fields_treat_none_as_default(app):
+    assert app.with_derived_fields({"item_name": "Tea", "quantity": None, "threshold": None})["low_stock"] is True
@@ -0,0 +1,13 @@
+"""Session claims that are re-checked rather than trusted until the token is reissued."""
+import bench
+
+def test_admin_flag_is_rechecked(app):
+    users = app.db.collection('users')
+    users.document("ops@bench.test").set({"email": "ops@bench.test", "is_admin": True})
+    def check(app):
+        app.st.session_state.user_info = {"email": "ops@bench.test", "is_admin": True}
+        before = app.is_admin()
+        users.document("ops@bench.test").update({"is_admin": False})
+        app.lookup_user.clear("ops@bench.test")
+        return before, app.is_admin()
+    assert bench.in_app(check) == (True, False)
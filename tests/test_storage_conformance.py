@@ -0,0 +1,15 @@
+"""Storage conformance: every backend the app can run on passes the same checks (see bench.py).
+
+    python -m pytest tests
+    FIRESTORE_EMULATOR_HOST=localhost:8080 python -m pytest tests   # also against the emulator
+"""
+import pytest
+
+import bench
+
+@pytest.mark.parametrize("backend", bench.STORAGE_BACKENDS)
+def test_conformance(backend, tmp_path):
+    db = bench.storage_backend(backend, str(tmp_path))
+    if db is None: pytest.skip("FIRESTORE_EMULATOR_HOST is not set")
+    failed = [name for name, ok in bench._conformance_checks(db) if not ok]
+    assert not failed, f"{backend} failed: {', '.join(failed)}"
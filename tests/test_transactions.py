@@ -0,0 +1,33 @@
+"""The transaction decorator: stores that run their own transactions, and the Firestore client's."""
+import pytest
+from google.auth.credentials import AnonymousCredentials
+from google.cloud import firestore as cloud_firestore
+
+import sqlite_store
+
+@sqlite_store.transactional
+def restock(transaction, ref, qty):
+    transaction.update(ref, {"quantity": ref.get(transaction=transaction).to_dict()["quantity"] + qty})
+    if qty < 0: raise ValueError("negative restock")
+
+def test_sqlite_rolls_back_on_error(tmp_path):
+    db = sqlite_store.SqliteStore(str(tmp_path / "t.db"))
+    ref = db.collection('inventory').document("i1")
+    ref.set({"quantity": 1.0})
+    restock(db.transaction(), ref, 2.0)
+    with pytest.raises(ValueError): restock(db.transaction(), ref, -1.0)
+    assert ref.get().to_dict()["quantity"] == 3.0
+    restock(db.transaction(), ref, 1.0)   # the write lock was released by the rollback
+    assert ref.get().to_dict()["quantity"] == 4.0
+
+def test_firestore_client_goes_through_the_library(monkeypatch):
+    # Offline: the library's wrapper begins the transaction and rolls it back when the function raises
+    client = cloud_firestore.Client(project="kitchen-mind-test", credentials=AnonymousCredentials())
+    transaction, calls = client.transaction(), []
+    def begin(retry_id=None): calls.append("begin"); transaction._id = b"t1"
+    monkeypatch.setattr(transaction, "_begin", begin)
+    monkeypatch.setattr(transaction, "_rollback", lambda: calls.append("rollback"))
+    @sqlite_store.transactional
+    def abandon(transaction): raise ValueError("abandoned")
+    with pytest.raises(ValueError): abandon(transaction)
+    assert calls == ["begin", "rollback"]